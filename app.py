@@ -2,6 +2,8 @@ import streamlit as st
 from config import Config
 from database import mongodb
 from services import TemplateService
+from services.stats_service import StatsService
+import pandas as pd
 import sys
 
 # Page configuration
@@ -92,7 +94,10 @@ def show_sidebar():
         
         st.markdown("---")
         st.markdown("#### Settings")
-        st.markdown(f"**Email:** {Config.GMAIL_EMAIL}")
+        if Config.SENDER_ACCOUNTS:
+            st.markdown(f"**Sender Accounts:** {len(Config.SENDER_ACCOUNTS)}")
+        else:
+            st.markdown(f"**Email:** {Config.GMAIL_EMAIL}")
         st.markdown(f"**Rate Limit:** {Config.RATE_LIMIT_EMAILS_PER_MINUTE}/min")
         
         return page
@@ -101,13 +106,16 @@ def show_dashboard():
     """Display dashboard with statistics"""
     st.markdown('<h1 class="main-header">📊 Dashboard</h1>', unsafe_allow_html=True)
     
-    # Get statistics from database
+    # Get statistics from the pre-aggregated counters
     campaigns_collection = mongodb.campaigns
-    logs_collection = mongodb.email_logs
+    stats_service = StatsService()
     
-    total_campaigns = campaigns_collection.count_documents({})
-    total_emails_sent = logs_collection.count_documents({'status': 'sent'})
-    total_emails_failed = logs_collection.count_documents({'status': 'failed'})
+    stats = stats_service.get_global()
+    total_campaigns = stats['campaigns']
+    total_emails_sent = stats['sent']
+    total_emails_failed = stats['failed']
+    if stats['needs_rebuild']:
+        st.warning("Statistics have not been built from the existing email logs yet. Run `python -m services.stats_service rebuild`.")
     
     # Display stats
     col1, col2, col3 = st.columns(3)
@@ -138,6 +146,12 @@ def show_dashboard():
     
     st.markdown("<br>", unsafe_allow_html=True)
     
+    # Daily activity
+    daily = stats_service.get_daily()
+    if daily:
+        st.subheader("📈 Last 30 Days")
+        st.line_chart(pd.DataFrame(daily).set_index('date'))
+    
     # Recent campaigns
     st.subheader("📋 Recent Campaigns")
     
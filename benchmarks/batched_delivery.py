@@ -0,0 +1,83 @@
+"""
+Benchmark: one SMTP transaction per recipient vs. batched RCPT delivery
+
+Sends a newsletter whose content varies only by company to a fake SMTP
+server that counts transactions, RCPT TO commands, round trips and bytes.
+smtplib does not pipeline, so a transaction costs MAIL, DATA and the
+end of data, plus one round trip per RCPT.
+
+Run from the project root:
+    python -m benchmarks.batched_delivery [recipients]
+"""
+import smtplib
+import sys
+import time
+from benchmarks.fake_smtp import FakeShard
+from config import Config
+from services.email_service import EmailService
+
+SUBJECT = 'News for {company}'
+TEMPLATE = '<html><body><h1>{company} monthly update</h1><p>{message}</p></body></html>'
+
+# Addresses the fake server refuses at RCPT TO
+REFUSED_SUFFIX = '@blocked.example.com'
+
+
+def counting_server(stats):
+    """Deliver callback that counts what a real server would receive; refuses REFUSED_SUFFIX addresses"""
+    def deliver(to_addrs, msg):
+        stats['transactions'] += 1
+        stats['rcpts'] += len(to_addrs)
+        stats['bytes'] += len(msg)
+        refused = {
+            address: (550, b'5.1.1 Mailbox unavailable')
+            for address in to_addrs if address.endswith(REFUSED_SUFFIX)
+        }
+        if len(refused) == len(to_addrs):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        return refused
+    return deliver
+
+
+def run(recipients, batch_size):
+    stats = {'transactions': 0, 'rcpts': 0, 'bytes': 0}
+    service = EmailService(shards=[FakeShard(counting_server(stats))])
+    start = time.perf_counter()
+    results = service.send_bulk_emails(recipients, SUBJECT, TEMPLATE, batch_size=batch_size)
+    stats['seconds'] = time.perf_counter() - start
+    stats['round_trips'] = stats['transactions'] * 3 + stats['rcpts']
+    return stats, results
+
+
+def main(count: int = 20000):
+    recipients = [
+        {
+            'email': f'user{i}{REFUSED_SUFFIX}' if i % 97 == 0 else f'user{i}@example.com',
+            'company': f'Company {i % 20}',
+            'message': 'Here is what changed this month.'
+        }
+        for i in range(count)
+    ]
+    Config.SEND_MAX_RETRIES = 0
+
+    single, single_results = run(recipients, 1)
+    batched, batched_results = run(recipients, 50)
+
+    # Refused recipients must fail individually in both modes
+    assert single_results['sent_count'] == batched_results['sent_count']
+    assert sorted(e['email'] for e in single_results['errors']) == \
+        sorted(e['email'] for e in batched_results['errors'])
+
+    print(f"{count} recipients, {batched_results['failed_count']} refused at RCPT TO")
+    print(f"{'':24}{'transactions':>14}{'round trips':>14}{'MB sent':>10}{'time':>9}")
+    for label, stats in (('One per recipient:', single), ('Batches of 50:', batched)):
+        print(
+            f"{label:24}{stats['transactions']:>14,}{stats['round_trips']:>14,}"
+            f"{stats['bytes'] / 1e6:>10.1f}{stats['seconds']:>8.2f}s"
+        )
+    print(f"Transactions reduced:   {single['transactions'] / batched['transactions']:8.1f}x")
+    print(f"Round trips reduced:    {single['round_trips'] / batched['round_trips']:8.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
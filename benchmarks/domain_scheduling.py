@@ -0,0 +1,86 @@
+"""
+Benchmark: sending a domain-sorted list in upload order vs. by DomainScheduler
+
+Fake receiving servers each accept MX_MAX_SESSIONS concurrent deliveries
+and defer the rest with 421, as large providers do. The list is sorted by
+domain, so in upload order every parallel session hits the same server.
+
+Run from the project root:
+    python -m benchmarks.domain_scheduling [recipients]
+"""
+import smtplib
+import sys
+import threading
+import time
+from collections import Counter
+from benchmarks.fake_smtp import FakeShard
+from config import Config
+from services.domain_scheduler import recipient_domain
+from services.email_service import EmailService
+
+DOMAINS = ['gmail.example', 'outlook.example', 'yahoo.example', 'corp.example']
+MX_MAX_SESSIONS = 2
+LATENCY = 0.005
+CONCURRENCY = 8
+
+
+class FakeMX:
+    """Receiving servers that defer deliveries beyond MX_MAX_SESSIONS per domain"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = Counter()
+        self.deferred = Counter()
+
+    def deliver(self, to_addrs):
+        domain = recipient_domain(to_addrs[0])
+        with self.lock:
+            if self.in_flight[domain] >= MX_MAX_SESSIONS:
+                self.deferred[domain] += 1
+                raise smtplib.SMTPResponseException(421, b'4.7.0 Too many concurrent connections')
+            self.in_flight[domain] += 1
+        time.sleep(LATENCY)
+        with self.lock:
+            self.in_flight[domain] -= 1
+
+    def sendmail(self, to_addrs, msg):
+        """Deliver callback for FakeShard"""
+        self.deliver(to_addrs)
+        return {}
+
+
+def run(recipients, scheduled):
+    Config.DOMAIN_LOOKAHEAD = 1000 if scheduled else 1
+    Config.DOMAIN_MAX_CONCURRENCY = MX_MAX_SESSIONS if scheduled else 0
+    mx = FakeMX()
+    service = EmailService(shards=[FakeShard(mx.sendmail)])
+    start = time.perf_counter()
+    results = service.send_bulk_emails(recipients, 'Hello {name}', '<p>Hi {name}</p>', concurrency=CONCURRENCY)
+    return results, sum(mx.deferred.values()), time.perf_counter() - start
+
+
+def main(count: int = 2000):
+    # Throttled sends are retried without pausing, and never bench the shard
+    Config.ADAPTIVE_RATE_ENABLED = False
+    Config.SHARD_MAX_CONSECUTIVE_FAILURES = 10 ** 9
+    Config.SEND_MAX_RETRIES = 3
+
+    per_domain = count // len(DOMAINS)
+    recipients = [
+        {'email': f'user{i}@{domain}', 'name': f'User {i}'}
+        for domain in DOMAINS for i in range(per_domain)
+    ]
+
+    print(f"{len(recipients)} recipients sorted by domain, {len(DOMAINS)} domains, "
+          f"{CONCURRENCY} sessions, servers allow {MX_MAX_SESSIONS} each")
+    print(f"{'':20}{'sent':>8}{'failed':>8}{'deferrals':>11}{'time':>9}{'msgs/s':>9}")
+    for label, scheduled in (('Upload order:', False), ('DomainScheduler:', True)):
+        results, deferred, seconds = run(recipients, scheduled)
+        print(
+            f"{label:20}{results['sent_count']:>8}{results['failed_count']:>8}"
+            f"{deferred:>11}{seconds:>8.2f}s{results['sent_count'] / seconds:>9.0f}"
+        )
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
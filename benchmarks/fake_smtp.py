@@ -0,0 +1,41 @@
+"""
+In-process SMTP stand-ins shared by the delivery benchmarks
+
+A FakeShard hands out FakeSMTP sessions that pass every sendmail call to
+a `deliver(to_addrs, msg)` callback instead of the network. The callback
+returns the refused recipients like smtplib's sendmail, or raises.
+"""
+from typing import Callable, Dict, List
+from services.sender_shards import SenderShard
+
+Deliver = Callable[[List[str], bytes], Dict]
+
+
+class FakeSMTP:
+    """Session whose transactions go to the deliver callback"""
+
+    def __init__(self, deliver: Deliver):
+        self.deliver = deliver
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        return self.deliver(to_addrs, msg)
+
+    def noop(self):
+        return 250, b'OK'
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeShard(SenderShard):
+    """Sender account with no rate limit whose sessions are FakeSMTP"""
+
+    def __init__(self, deliver: Deliver):
+        self.deliver = deliver
+        super().__init__('bench', 'sender@example.com', 'secret', rate_per_minute=10 ** 9)
+
+    def connect(self):
+        return FakeSMTP(self.deliver)
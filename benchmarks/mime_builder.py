@@ -0,0 +1,70 @@
+"""
+Benchmark: MIMEMultipart serialization vs. MessageSkeleton byte splicing
+
+Run from the project root:
+    python -m benchmarks.mime_builder [messages]
+"""
+import sys
+import time
+from email import message_from_bytes
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from services.mime_builder import MessageSkeleton
+from services.template_service import TemplateService, compile_template
+
+FROM_EMAIL = 'sender@example.com'
+
+
+def build_with_email_package(to_email: str, subject: str, html_content: str) -> bytes:
+    """The per-recipient message path used before MessageSkeleton"""
+    msg = MIMEMultipart('alternative')
+    msg['From'] = FROM_EMAIL
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(html_content, 'html'))
+    return msg.as_bytes()
+
+
+def main(count: int = 20000):
+    template = TemplateService._get_default_templates(None)[0].html_content
+    body = compile_template(template)
+    recipients = [
+        {
+            'email': f'user{i}@example.com',
+            'name': f'User {i}',
+            'message': 'Thanks for being a customer — here is your update.',
+            'sender_name': 'Example Corp'
+        }
+        for i in range(count)
+    ]
+    messages = [
+        (r['email'], f"Hello {r['name']}", body.render(r))
+        for r in recipients
+    ]
+
+    start = time.perf_counter()
+    for to_email, subject, html_content in messages:
+        build_with_email_package(to_email, subject, html_content)
+    legacy = time.perf_counter() - start
+
+    skeleton = MessageSkeleton()
+    start = time.perf_counter()
+    for to_email, subject, html_content in messages:
+        skeleton.build(FROM_EMAIL, to_email, subject, html_content)
+    spliced = time.perf_counter() - start
+
+    # The spliced message must parse back to the same headers and body
+    to_email, subject, html_content = messages[0]
+    parsed = message_from_bytes(skeleton.build(FROM_EMAIL, to_email, subject, html_content))
+    part = parsed.get_payload()[0]
+    assert parsed['To'] == to_email and parsed['Subject'] == subject
+    assert part.get_payload(decode=True).decode('utf-8') == html_content
+
+    print(f"{count} messages")
+    print(f"MIMEMultipart:   {legacy:.3f}s ({count / legacy:,.0f} msg/s)")
+    print(f"MessageSkeleton: {spliced:.3f}s ({count / spliced:,.0f} msg/s)")
+    print(f"Speedup:         {legacy / spliced:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
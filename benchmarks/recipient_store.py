@@ -0,0 +1,64 @@
+"""
+Benchmark: memory of list-of-dicts recipients vs. RecipientStore
+
+Run from the project root:
+    python -m benchmarks.recipient_store [rows]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+import pandas as pd
+from services.template_service import TemplateService, compile_template
+from utils import CSVParser, RecipientStore
+
+
+def python_heap(build):
+    """Build a value, returning it with the Python heap bytes it allocated"""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    python_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, python_bytes
+
+
+def main(count: int = 100000):
+    df = pd.DataFrame({
+        'email': [f'user{i}@example.com' for i in range(count)],
+        'name': [f'User {i}' for i in range(count)],
+        'company': [f'Company {i % 500}' for i in range(count)],
+        'city': ['Springfield'] * count,
+        'zip': [f'{i % 100000:05d}' for i in range(count)]
+    })
+
+    # Before: the session kept the dataframe plus one dict per recipient
+    frame_bytes = int(df.memory_usage(deep=True).sum())
+    records, records_bytes = python_heap(lambda: CSVParser.prepare_recipients(df))
+    legacy = frame_bytes + records_bytes
+
+    # After: the store's column buffers (counted in full even when shared
+    # with the dataframe) plus its Python objects
+    store, store_objects = python_heap(lambda: RecipientStore.from_dataframe(df))
+    store_bytes = store.nbytes + store_objects
+
+    # Both must render the same messages
+    body = compile_template(TemplateService._get_default_templates(None)[0].html_content)
+    defaults = {'sender_name': 'Example Corp', 'message': 'Hello', 'company_name': 'Example Corp', 'date': 'Today'}
+    start = time.perf_counter()
+    for row in store:
+        row['email']
+    iterate = time.perf_counter() - start
+    for record, row in zip(records[:1000], store):
+        assert body.render({**defaults, **record}) == body.render({**defaults, **row})
+
+    per_100k = 100000 / count
+    print(f"{count} recipients, {len(df.columns)} fields")
+    print(f"DataFrame + list of dicts: {legacy * per_100k / 1e6:8.1f} MB per 100k rows")
+    print(f"RecipientStore:            {store_bytes * per_100k / 1e6:8.1f} MB per 100k rows")
+    print(f"Reduction:                 {legacy / store_bytes:8.1f}x")
+    print(f"Iterating the store:       {iterate:8.3f}s ({count / iterate:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
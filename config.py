@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -14,27 +15,121 @@ class Config:
     # MongoDB Settings
     MONGODB_URI = os.getenv('MONGODB_URI')
     MONGODB_DB_NAME = os.getenv('MONGODB_DB_NAME', 'bulk_emailer')
+    # Create indexes and warn about unindexed hot queries when connecting
+    MONGODB_CREATE_INDEXES = os.getenv('MONGODB_CREATE_INDEXES', 'true').lower() == 'true'
+    MONGODB_CHECK_QUERY_PLANS = os.getenv('MONGODB_CHECK_QUERY_PLANS', 'true').lower() == 'true'
     
     # Application Settings
     APP_TITLE = os.getenv('APP_TITLE', 'Bulk Email Sender')
     RATE_LIMIT_EMAILS_PER_MINUTE = int(os.getenv('RATE_LIMIT_EMAILS_PER_MINUTE', 30))
+    RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 5))
+    # 'local' (per process) or 'mongodb' (shared by every sender process)
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'local')
+    RATE_LIMIT_KEY = os.getenv('RATE_LIMIT_KEY', f"smtp:{GMAIL_EMAIL}")
+    
+    # Adaptive (AIMD) rate control driven by SMTP throttling replies
+    ADAPTIVE_RATE_ENABLED = os.getenv('ADAPTIVE_RATE_ENABLED', 'true').lower() == 'true'
+    ADAPTIVE_RATE_MIN_PER_MINUTE = float(os.getenv('ADAPTIVE_RATE_MIN_PER_MINUTE', 5))
+    ADAPTIVE_RATE_MAX_PER_MINUTE = float(os.getenv('ADAPTIVE_RATE_MAX_PER_MINUTE', RATE_LIMIT_EMAILS_PER_MINUTE * 2))
+    ADAPTIVE_RATE_INCREASE = float(os.getenv('ADAPTIVE_RATE_INCREASE', 5))
+    ADAPTIVE_RATE_DECREASE_FACTOR = float(os.getenv('ADAPTIVE_RATE_DECREASE_FACTOR', 0.5))
+    ADAPTIVE_RATE_COOLDOWN = float(os.getenv('ADAPTIVE_RATE_COOLDOWN', 30))
+    SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', 3))
+    
+    # Sender sharding: JSON list of accounts, each with email, password and
+    # optional name, smtp_server, smtp_port, rate_per_minute, daily_quota, weight,
+    # rate_limit_key.
+    # Defaults to the single Gmail account above.
+    SENDER_ACCOUNTS = json.loads(os.getenv('SENDER_ACCOUNTS', '[]'))
+    SHARD_MAX_CONSECUTIVE_FAILURES = int(os.getenv('SHARD_MAX_CONSECUTIVE_FAILURES', 5))
+    SHARD_UNHEALTHY_COOLDOWN = float(os.getenv('SHARD_UNHEALTHY_COOLDOWN', 300))
     
     # Email Settings
     SMTP_SERVER = 'smtp.gmail.com'
     SMTP_PORT = 587
+
+    # SMTP Connection Pool Settings
+    SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', 4))
+    SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', 100))
+    SMTP_MAX_CONNECTION_AGE = float(os.getenv('SMTP_MAX_CONNECTION_AGE', 300))
+    SMTP_NOOP_AFTER_IDLE = float(os.getenv('SMTP_NOOP_AFTER_IDLE', 5))
+
+    # Number of parallel SMTP sessions used by send_bulk_emails (1 = serial)
+    SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', 1))
+    # Recipients of an identical message sent in one SMTP transaction (1 = one per message),
+    # and whether they are listed in the To header ('to') or hidden ('bcc')
+    SEND_BATCH_SIZE = int(os.getenv('SEND_BATCH_SIZE', 1))
+    SEND_BATCH_HEADER = os.getenv('SEND_BATCH_HEADER', 'bcc')
+
+    # Per-destination-domain scheduling: sends in flight and sends per minute allowed to one
+    # recipient domain (0 = no limit), recipients read ahead to interleave domains, and JSON
+    # overrides per domain, e.g. {"gmail.com": {"max_concurrency": 4, "rate_per_minute": 120}}
+    DOMAIN_MAX_CONCURRENCY = int(os.getenv('DOMAIN_MAX_CONCURRENCY', 0))
+    DOMAIN_RATE_PER_MINUTE = float(os.getenv('DOMAIN_RATE_PER_MINUTE', 0))
+    DOMAIN_LOOKAHEAD = int(os.getenv('DOMAIN_LOOKAHEAD', 1000))
+    DOMAIN_LIMITS = json.loads(os.getenv('DOMAIN_LIMITS', '{}'))
+
+    # Number of compiled templates kept in memory
+    TEMPLATE_CACHE_SIZE = int(os.getenv('TEMPLATE_CACHE_SIZE', 128))
+    # Rendered messages kept per campaign for recipients sharing merge values
+    RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', 256))
+
+    # Encoded attachments kept in memory, and the file size above which they are memory-mapped
+    ATTACHMENT_CACHE_SIZE = int(os.getenv('ATTACHMENT_CACHE_SIZE', 16))
+    ATTACHMENT_MMAP_THRESHOLD = int(os.getenv('ATTACHMENT_MMAP_THRESHOLD', 1024 * 1024))
+
+    # asyncio pipeline: concurrent SMTP sessions and per-stage queue capacity
+    ASYNC_SMTP_SESSIONS = int(os.getenv('ASYNC_SMTP_SESSIONS', 10))
+    ASYNC_QUEUE_SIZE = int(os.getenv('ASYNC_QUEUE_SIZE', 100))
+
+    # Rows per chunk when reading CSV files, and invalid addresses kept as examples when streaming
+    CSV_CHUNK_SIZE = int(os.getenv('CSV_CHUNK_SIZE', 50000))
+    CSV_INVALID_SAMPLE_SIZE = int(os.getenv('CSV_INVALID_SAMPLE_SIZE', 100))
+    
+    # Full email validation runs in a process pool above this many unique addresses
+    VALIDATION_PARALLEL_THRESHOLD = int(os.getenv('VALIDATION_PARALLEL_THRESHOLD', 5000))
+    VALIDATION_WORKERS = int(os.getenv('VALIDATION_WORKERS', 0)) or None  # default: CPU count
+    
+    # Parsed uploads cached on disk (default directory: <tmp>/emailer_upload_cache)
+    UPLOAD_CACHE_DIR = os.getenv('UPLOAD_CACHE_DIR')
+    UPLOAD_CACHE_SIZE = int(os.getenv('UPLOAD_CACHE_SIZE', 8))
+
+    # Seconds between incremental reloads of the suppression list
+    SUPPRESSION_REFRESH_INTERVAL = float(os.getenv('SUPPRESSION_REFRESH_INTERVAL', 60))
     
+    # Campaigns per Campaign History page
+    HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+    # Email log rows per page in campaign details, and per cursor batch when exporting
+    LOG_PAGE_SIZE = int(os.getenv('LOG_PAGE_SIZE', 100))
+    LOG_EXPORT_BATCH_SIZE = int(os.getenv('LOG_EXPORT_BATCH_SIZE', 5000))
+
+    # Background campaign workers (python -m services.campaign_worker)
+    WORKER_POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', 5))
+    WORKER_LEASE_SECONDS = float(os.getenv('WORKER_LEASE_SECONDS', 60))
+    CAMPAIGN_PROGRESS_INTERVAL = float(os.getenv('CAMPAIGN_PROGRESS_INTERVAL', 2))
+    # Email logs are written in batches of LOG_BATCH_SIZE, or every LOG_FLUSH_INTERVAL seconds
+    LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', 500))
+    LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', 2))
+    # Seconds between a worker's pause/cancel, lease renewal and log flush checks
+    CAMPAIGN_CONTROL_INTERVAL = float(os.getenv('CAMPAIGN_CONTROL_INTERVAL', 1))
+
     @classmethod
     def validate(cls):
         """Validate that all required configuration is present"""
-        required = [
-            ('GMAIL_EMAIL', cls.GMAIL_EMAIL),
-            ('GMAIL_APP_PASSWORD', cls.GMAIL_APP_PASSWORD),
-            ('MONGODB_URI', cls.MONGODB_URI)
-        ]
+        required = [('MONGODB_URI', cls.MONGODB_URI)]
+        if not cls.SENDER_ACCOUNTS:
+            required += [
+                ('GMAIL_EMAIL', cls.GMAIL_EMAIL),
+                ('GMAIL_APP_PASSWORD', cls.GMAIL_APP_PASSWORD)
+            ]
         
         missing = [name for name, value in required if not value]
         
         if missing:
             raise ValueError(f"Missing required configuration: {', '.join(missing)}")
         
+        for i, account in enumerate(cls.SENDER_ACCOUNTS):
+            if not account.get('email') or not account.get('password'):
+                raise ValueError(f"SENDER_ACCOUNTS entry {i} needs an email and password")
+        
         return True
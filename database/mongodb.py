@@ -1,8 +1,64 @@
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from datetime import datetime
+import gridfs
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, MongoClient
+from pymongo.errors import ConnectionFailure, PyMongoError, ServerSelectionTimeoutError
 from config import Config
 import streamlit as st
 
+# Indexes per collection, created idempotently at connect time
+INDEXES = {
+    'email_logs': [
+        # Campaign logs by status, paged by _id
+        IndexModel([('campaign_id', ASCENDING), ('status', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('campaign_id', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('status', ASCENDING)]),
+        IndexModel([('recipient_email', ASCENDING)]),
+        # Only queued campaigns have keys; logs without one are not indexed
+        IndexModel(
+            [('idempotency_key', ASCENDING)],
+            unique=True,
+            partialFilterExpression={'idempotency_key': {'$exists': True}}
+        )
+    ],
+    'campaigns': [
+        # Keyset pagination of the history (also serves the queue claim, walked backwards)
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('name', TEXT), ('subject', TEXT)], name='campaign_text')
+    ],
+    'campaign_recipients': [
+        IndexModel([('campaign_id', ASCENDING), ('index', ASCENDING)], unique=True),
+        IndexModel([('campaign_id', ASCENDING), ('status', ASCENDING), ('index', ASCENDING)])
+    ],
+    'suppressions': [
+        # Incremental refresh of the in-memory suppression list
+        IndexModel([('updated_at', ASCENDING)])
+    ]
+}
+
+# Queries run on every page load or send, as (name, collection, filter, sort)
+HOT_QUERIES = [
+    ('campaign logs', 'email_logs', {'campaign_id': ''}, None),
+    ('campaign logs by status', 'email_logs', {'campaign_id': '', 'status': 'failed'}, None),
+    ('recent campaigns', 'campaigns', {}, [('created_at', DESCENDING)]),
+    ('history page by status', 'campaigns', {'status': 'completed'}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('queue claim', 'campaigns', {'status': 'queued'}, [('created_at', ASCENDING)]),
+    ('pending recipients', 'campaign_recipients', {'campaign_id': '', 'status': 'pending'}, [('index', ASCENDING)]),
+    ('recipient checkpoint', 'campaign_recipients', {'campaign_id': '', 'index': 0}, None),
+    ('daily stats', 'stats', {'_id': {'$gte': 'day:2000-01-01', '$lt': 'day:~'}}, [('_id', ASCENDING)]),
+    ('suppression refresh', 'suppressions', {'updated_at': {'$gt': datetime(2000, 1, 1)}}, [('updated_at', ASCENDING)])
+]
+
+
+def _plan_stages(plan: dict):
+    """Yield every stage name in an explain() plan tree"""
+    yield plan.get('stage')
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+
 class MongoDB:
     """MongoDB connection manager"""
     
@@ -26,6 +82,11 @@ class MongoDB:
                 # Test the connection
                 self._client.admin.command('ping')
                 self._db = self._client[Config.MONGODB_DB_NAME]
+                if Config.MONGODB_CREATE_INDEXES:
+                    self.ensure_indexes()
+                if Config.MONGODB_CHECK_QUERY_PLANS:
+                    for name in self.check_query_plans():
+                        print(f"Warning: query '{name}' is not covered by an index (collection scan)")
                 return True
             except (ConnectionFailure, ServerSelectionTimeoutError) as e:
                 st.error(f"Failed to connect to MongoDB: {str(e)}")
@@ -49,11 +110,70 @@ class MongoDB:
         """Get email logs collection"""
         return self.db.email_logs
     
+    @property
+    def campaign_recipients(self):
+        """Get queued campaign recipients collection"""
+        return self.db.campaign_recipients
+    
     @property
     def templates(self):
         """Get templates collection"""
         return self.db.templates
     
+    @property
+    def stats(self):
+        """Get pre-aggregated statistics collection"""
+        return self.db.stats
+    
+    @property
+    def suppressions(self):
+        """Get suppressed (unsubscribed, bounced) addresses collection"""
+        return self.db.suppressions
+    
+    @property
+    def rate_limits(self):
+        """Get shared rate limiter buckets collection"""
+        return self.db.rate_limits
+    
+    @property
+    def sender_quotas(self):
+        """Get per-account daily send counts collection"""
+        return self.db.sender_quotas
+    
+    @property
+    def attachments(self):
+        """Get GridFS bucket of queued campaigns' attachment files"""
+        return gridfs.GridFSBucket(self.db, bucket_name='attachments')
+    
+    def ensure_indexes(self):
+        """Create the declared indexes; existing ones are left as they are"""
+        for collection, indexes in INDEXES.items():
+            try:
+                self.db[collection].create_indexes(indexes)
+            except PyMongoError as e:
+                print(f"Failed to create indexes on {collection}: {str(e)}")
+    
+    def check_query_plans(self) -> list:
+        """
+        Explain the hot queries and report those that scan a whole collection
+        
+        Returns:
+            Names of the queries whose winning plan is a collection scan
+        """
+        uncovered = []
+        for name, collection, query, sort in HOT_QUERIES:
+            try:
+                cursor = self.db[collection].find(query)
+                if sort:
+                    cursor = cursor.sort(sort)
+                plan = cursor.explain()['queryPlanner']['winningPlan']
+            except (PyMongoError, KeyError) as e:
+                print(f"Failed to explain query '{name}': {str(e)}")
+                continue
+            if 'COLLSCAN' in set(_plan_stages(plan)):
+                uncovered.append(name)
+        return uncovered
+    
     def close(self):
         """Close MongoDB connection"""
         if self._client:
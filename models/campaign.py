@@ -61,7 +61,8 @@ class EmailLog:
         recipient_data: Dict,
         status: str = 'pending',
         error_message: Optional[str] = None,
-        sent_at: Optional[datetime] = None
+        sent_at: Optional[datetime] = None,
+        idempotency_key: Optional[str] = None
     ):
         self.campaign_id = campaign_id
         self.recipient_email = recipient_email
@@ -69,10 +70,11 @@ class EmailLog:
         self.status = status
         self.error_message = error_message
         self.sent_at = sent_at or datetime.now()
+        self.idempotency_key = idempotency_key
     
     def to_dict(self) -> Dict:
         """Convert to dictionary for MongoDB"""
-        return {
+        data = {
             'campaign_id': self.campaign_id,
             'recipient_email': self.recipient_email,
             'recipient_data': self.recipient_data,
@@ -80,6 +82,10 @@ class EmailLog:
             'error_message': self.error_message,
             'sent_at': self.sent_at
         }
+        # Only queued campaigns have keys; the unique index skips logs without one
+        if self.idempotency_key:
+            data['idempotency_key'] = self.idempotency_key
+        return data
 
 
 class Template:
@@ -1,5 +1,10 @@
+import os
 import streamlit as st
 from database import mongodb
+from services.campaign_queue import ACTIVE_STATUSES, RESUMABLE_STATUSES, CampaignQueue
+from services.history_service import HistoryService
+from services.log_export import FORMATS, MIME_TYPES, export_logs
+from services.stats_service import StatsService
 from datetime import datetime
 import pandas as pd
 
@@ -7,18 +12,18 @@ def show():
     """Campaign History Page"""
     st.markdown('<h1 class="main-header">📊 Campaign History</h1>', unsafe_allow_html=True)
     
-    # Get all campaigns
-    campaigns = list(mongodb.campaigns.find().sort('created_at', -1))
+    # Summary stats from the pre-aggregated counters
+    stats = StatsService().get_global()
+    total_campaigns = stats['campaigns']
+    total_sent = stats['sent']
+    total_failed = stats['failed']
+    if stats['needs_rebuild']:
+        st.warning("Statistics have not been built from the existing email logs yet. Run `python -m services.stats_service rebuild`.")
     
-    if not campaigns:
+    if not total_campaigns and not stats['needs_rebuild']:
         st.info("📭 No campaigns yet. Create your first campaign to get started!")
         return
     
-    # Summary stats
-    total_campaigns = len(campaigns)
-    total_sent = sum(c.get('sent_count', 0) for c in campaigns)
-    total_failed = sum(c.get('failed_count', 0) for c in campaigns)
-    
     col1, col2, col3 = st.columns(3)
     
     with col1:
@@ -34,27 +39,31 @@ def show():
     col1, col2 = st.columns([3, 1])
     
     with col1:
-        search = st.text_input("🔍 Search campaigns", placeholder="Search by name or subject...")
+        search = st.text_input("🔍 Search campaigns", placeholder="Search by words in the name or subject...")
     
     with col2:
-        status_filter = st.selectbox("Status", ["All", "completed", "sending", "draft", "failed"])
-    
-    # Filter campaigns
-    filtered_campaigns = campaigns
-    
-    if search:
-        filtered_campaigns = [
-            c for c in filtered_campaigns 
-            if search.lower() in c['name'].lower() or search.lower() in c['subject'].lower()
-        ]
-    
-    if status_filter != "All":
-        filtered_campaigns = [c for c in filtered_campaigns if c['status'] == status_filter]
+        status_filter = st.selectbox("Status", ["All", "completed", "sending", "queued", "paused", "cancelled", "draft", "failed"])
+    
+    # Page cursors: one per visited page, reset when the filters change
+    filters = (search.strip(), status_filter)
+    if st.session_state.get('history_filters') != filters:
+        st.session_state.history_filters = filters
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+    
+    campaigns, next_cursor = HistoryService().get_page(
+        status=None if status_filter == "All" else status_filter,
+        search=search.strip() or None,
+        after=cursors[-1]
+    )
     
     # Display campaigns
-    st.subheader(f"Campaigns ({len(filtered_campaigns)})")
+    st.subheader(f"Campaigns (page {len(cursors)})")
+    
+    if not campaigns:
+        st.info("No campaigns match your filters.")
     
-    for campaign in filtered_campaigns:
+    for campaign in campaigns:
         with st.expander(
             f"📧 {campaign['name']} - {campaign['status'].upper()} ({campaign.get('sent_count', 0)}/{campaign['recipients_count']} sent)"
         ):
@@ -65,6 +74,10 @@ def show():
                 st.write(f"**Campaign Name:** {campaign['name']}")
                 st.write(f"**Subject:** {campaign['subject']}")
                 st.write(f"**Status:** {campaign['status']}")
+                if campaign['status'] == 'sending' and campaign.get('progress'):
+                    st.write(f"**Progress:** {campaign['progress']['completed']}/{campaign['progress']['total']}")
+                if campaign.get('error'):
+                    st.write(f"**Error:** {campaign['error']}")
                 st.write(f"**Created:** {campaign['created_at'].strftime('%Y-%m-%d %H:%M:%S')}")
             
             with col2:
@@ -76,47 +89,126 @@ def show():
                     success_rate = (campaign.get('sent_count', 0) / campaign['recipients_count']) * 100
                     st.write(f"**Success Rate:** {success_rate:.1f}%")
             
+            # Pause, cancel or resume queued campaigns
+            if 'progress' in campaign:
+                show_campaign_controls(campaign)
+            
             # Show email logs
             if st.button("View Details", key=f"details_{campaign['_id']}"):
+                st.session_state.details_campaign_id = str(campaign['_id'])
+            if st.session_state.get('details_campaign_id') == str(campaign['_id']):
                 show_campaign_details(campaign['_id'])
+    
+    # Pagination
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(cursors) > 1 and st.button("← Newer", use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if next_cursor and st.button("Older →", use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
+
+def show_campaign_controls(campaign):
+    """Pause/cancel buttons for running campaigns, resume for paused or failed ones"""
+    queue = CampaignQueue()
+    campaign_id = str(campaign['_id'])
+    status = campaign['status']
+    
+    cols = st.columns(3)
+    if status in ACTIVE_STATUSES and not campaign.get('control'):
+        if cols[0].button("⏸️ Pause", key=f"pause_{campaign_id}"):
+            queue.request_control(campaign_id, 'pause')
+            st.rerun()
+    if status in RESUMABLE_STATUSES:
+        if cols[0].button("▶️ Resume", key=f"resume_{campaign_id}"):
+            queue.resume(campaign_id)
+            st.rerun()
+    if status in ACTIVE_STATUSES + ('paused',) and not campaign.get('control'):
+        if cols[1].button("⏹️ Cancel", key=f"cancel_{campaign_id}"):
+            queue.request_control(campaign_id, 'cancel')
+            st.rerun()
+
+def discard_export(campaign_id):
+    """Delete a campaign's prepared export file and forget it"""
+    export = st.session_state.pop(f"export_path_{campaign_id}", None)
+    if export:
+        try:
+            os.remove(export[0])
+        except OSError:
+            pass
 
 def show_campaign_details(campaign_id):
-    """Show detailed logs for a campaign"""
+    """Show a campaign's email logs a page at a time, with a streaming export"""
     st.subheader("📋 Email Logs")
+    campaign_id = str(campaign_id)
     
-    # Get all logs for this campaign
-    logs = list(mongodb.email_logs.find({'campaign_id': str(campaign_id)}))
+    # Status filter
+    status_filter = st.selectbox("Filter by status", ["All", "sent", "failed"], key=f"filter_{campaign_id}")
+    status = None if status_filter == "All" else status_filter
+    
+    # Page cursors: one per visited page, reset when the filter changes
+    cursor_key = f"log_cursors_{campaign_id}"
+    if st.session_state.get(f"log_filter_{campaign_id}") != status_filter:
+        st.session_state[f"log_filter_{campaign_id}"] = status_filter
+        st.session_state[cursor_key] = [None]
+    cursors = st.session_state[cursor_key]
     
-    if not logs:
+    logs, next_cursor = HistoryService().get_log_page(campaign_id, status, after=cursors[-1])
+    
+    if not logs and len(cursors) == 1:
         st.info("No logs found for this campaign.")
         return
     
     # Convert to dataframe
-    df_data = []
-    for log in logs:
-        df_data.append({
+    df = pd.DataFrame([
+        {
             'Email': log['recipient_email'],
             'Status': log['status'],
             'Sent At': log['sent_at'].strftime('%Y-%m-%d %H:%M:%S'),
-            'Error': log.get('error_message', '-')
-        })
-    
-    df = pd.DataFrame(df_data)
-    
-    # Status filter
-    status_filter = st.selectbox("Filter by status", ["All", "sent", "failed"], key=f"filter_{campaign_id}")
-    
-    if status_filter != "All":
-        df = df[df['Status'] == status_filter]
+            'Error': log.get('error_message') or '-'
+        }
+        for log in logs
+    ])
     
     # Display dataframe
     st.dataframe(df, use_container_width=True)
     
-    # Download option
-    csv = df.to_csv(index=False)
-    st.download_button(
-        label="📥 Download Logs as CSV",
-        data=csv,
-        file_name=f"campaign_logs_{campaign_id}.csv",
-        mime="text/csv"
-    )
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(cursors) > 1 and st.button("← Previous", key=f"log_prev_{campaign_id}", use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if next_cursor is not None and st.button("Next →", key=f"log_next_{campaign_id}", use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
+    
+    # Download option: the export is streamed to a file from a batched cursor
+    col1, col2 = st.columns(2)
+    with col1:
+        fmt = st.selectbox("Export format", list(FORMATS), key=f"export_format_{campaign_id}")
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        if st.button("Prepare Export", key=f"export_{campaign_id}", use_container_width=True):
+            discard_export(campaign_id)
+            try:
+                st.session_state[f"export_path_{campaign_id}"] = (export_logs(campaign_id, fmt, status), fmt)
+            except ValueError as e:
+                st.error(f"❌ {str(e)}")
+    
+    export = st.session_state.get(f"export_path_{campaign_id}")
+    if export and os.path.exists(export[0]):
+        path, export_format = export
+        with open(path, 'rb') as f:
+            st.download_button(
+                label=f"📥 Download Logs ({export_format})",
+                data=f,
+                file_name=f"campaign_logs_{campaign_id}{FORMATS[export_format]}",
+                mime=MIME_TYPES[export_format],
+                key=f"download_{campaign_id}",
+                # The button's data is already held by Streamlit, so the file can go
+                on_click=discard_export,
+                args=(campaign_id,)
+            )
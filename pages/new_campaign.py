@@ -1,9 +1,17 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
 import streamlit as st
 from datetime import datetime
+from config import Config
 from database import mongodb
 from services import EmailService, TemplateService
-from utils import CSVParser
-from models import Campaign, EmailLog
+from services.campaign_queue import ACTIVE_STATUSES, CampaignQueue
+from services.suppression import SuppressionList
+from utils import CSVFormatError, CSVParser, RecipientStore, UploadCache
+from models import Campaign
 import pandas as pd
 
 def show():
@@ -59,35 +67,77 @@ def show_step_upload_csv():
     uploaded_file = st.file_uploader("Choose a CSV file", type=['csv'])
     
     if uploaded_file:
-        # Parse CSV
-        success, df, error = CSVParser.parse_csv(uploaded_file)
-        
-        if not success:
-            st.error(f"❌ {error}")
-            return
+        # Parse and validate once per distinct file; reruns and re-uploads reuse the result
+        data = uploaded_file.getvalue()
+        upload_key = UploadCache.content_key(data)
+        if st.session_state.get('upload_key') == upload_key:
+            parsed = st.session_state.upload_parsed
+        else:
+            upload_cache = UploadCache()
+            parsed = upload_cache.get(upload_key)
+            if parsed is None:
+                # Parse and validate a chunk at a time straight into the columnar store
+                report = {}
+                try:
+                    recipients = RecipientStore.from_records(CSVParser.iter_recipients(uploaded_file, report))
+                except pd.errors.EmptyDataError:
+                    st.error("❌ CSV file is empty")
+                    return
+                except CSVFormatError as e:
+                    st.error(f"❌ {str(e)}")
+                    return
+                except Exception as e:
+                    st.error(f"❌ Error parsing CSV: {str(e)}")
+                    return
+                
+                if not report['valid'] and not report['invalid']:
+                    st.error("❌ CSV file is empty")
+                    return
+                
+                parsed = {
+                    'invalid_count': report['invalid'],
+                    'invalid_emails': report['invalid_emails'],
+                    'invalid_reasons': report['reasons'],
+                    'recipients': recipients,
+                    'available_fields': recipients.fields
+                }
+                upload_cache.put(upload_key, parsed)
+            
+            # Drop suppressed and repeated addresses; not cached, as the suppression list changes
+            keep, removed = SuppressionList.shared().filter(parsed['recipients'].column('email'))
+            parsed = dict(parsed, recipients=parsed['recipients'].filter(keep), removed=removed)
+            st.session_state.upload_key = upload_key
+            st.session_state.upload_parsed = parsed
         
-        # Validate emails
-        valid_df, invalid_emails = CSVParser.validate_emails(df)
+        recipients = parsed['recipients']
+        invalid_emails = parsed['invalid_emails']
         
         # Show preview
-        st.success(f"✅ Found {len(valid_df)} valid recipients")
+        st.success(f"✅ Found {len(recipients)} valid recipients")
+        
+        if parsed['removed']:
+            details = ', '.join(f"{count} {reason.replace('_', ' ')}" for reason, count in parsed['removed'].items())
+            st.info(f"🚫 Removed {sum(parsed['removed'].values())} address(es) that will not be mailed: {details}")
         
         if invalid_emails:
-            with st.expander(f"⚠️ {len(invalid_emails)} invalid email(s) found (will be skipped)"):
+            with st.expander(f"⚠️ {parsed['invalid_count']} invalid email(s) found (will be skipped)"):
+                for reason, count in parsed['invalid_reasons'].items():
+                    st.write(f"**{reason}:** {count}")
+                if parsed['invalid_count'] > len(invalid_emails):
+                    st.write(f"First {len(invalid_emails)} invalid addresses:")
                 for email in invalid_emails:
                     st.write(f"- {email}")
         
         # Show data preview
         st.subheader("📊 Data Preview")
-        st.dataframe(valid_df.head(10), use_container_width=True)
+        st.dataframe(recipients.head(10), use_container_width=True)
         
-        st.markdown(f"**Total Recipients:** {len(valid_df)}")
-        st.markdown(f"**Available Fields:** {', '.join(CSVParser.get_available_fields(valid_df))}")
+        st.markdown(f"**Total Recipients:** {len(recipients)}")
+        st.markdown(f"**Available Fields:** {', '.join(parsed['available_fields'])}")
         
         # Save to session state
-        st.session_state.recipients_df = valid_df
-        st.session_state.recipients = CSVParser.prepare_recipients(valid_df)
-        st.session_state.available_fields = CSVParser.get_available_fields(valid_df)
+        st.session_state.recipients = recipients
+        st.session_state.available_fields = parsed['available_fields']
         
         # Next button
         st.markdown("<br>", unsafe_allow_html=True)
@@ -177,12 +227,21 @@ def show_step_customize_email(template_service):
                 key=f"field_{field}"
             )
     
+    # Attachments
+    st.subheader("📎 Attachments")
+    uploaded_attachments = st.file_uploader(
+        "Files attached to every email (optional)",
+        accept_multiple_files=True,
+        key="attachment_uploads"
+    )
+    st.session_state.attachments = save_attachments(uploaded_attachments)
+    
     # Preview
     st.subheader("👁️ Preview")
     
     if st.session_state.recipients:
         # Get first recipient for preview
-        first_recipient = st.session_state.recipients[0].copy()
+        first_recipient = dict(st.session_state.recipients[0])
         
         # Merge with field values
         preview_data = first_recipient.copy()
@@ -193,7 +252,7 @@ def show_step_customize_email(template_service):
         
         try:
             preview_html = template_service.render_template(template.html_content, preview_data)
-            preview_subject = subject.format(**preview_data) if subject else "No subject"
+            preview_subject = template_service.compile_template(subject).render(preview_data) if subject else "No subject"
             
             st.write(f"**Subject:** {preview_subject}")
             with st.expander("📧 Email Preview", expanded=True):
@@ -224,16 +283,54 @@ def show_step_customize_email(template_service):
         else:
             st.button("Fill all fields to continue", disabled=True, use_container_width=True)
 
+def save_attachments(uploaded_files):
+    """
+    Write uploaded attachments to a per-session directory and return their paths
+    
+    Each file is stored under a hash of its content and written only once,
+    so the attachment cache (keyed by path, mtime and size) keeps hitting
+    across reruns.
+    """
+    if not uploaded_files:
+        return []
+    
+    if 'attachment_dir' not in st.session_state:
+        st.session_state.attachment_dir = tempfile.mkdtemp(prefix='emailer_attachments_')
+    
+    paths = []
+    for uploaded_file in uploaded_files:
+        data = uploaded_file.getvalue()
+        directory = os.path.join(st.session_state.attachment_dir, hashlib.blake2b(data, digest_size=8).hexdigest())
+        path = os.path.join(directory, os.path.basename(uploaded_file.name))
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        paths.append(path)
+    return paths
+
+def discard_attachments():
+    """Remove the session's attachment directory once its files are no longer needed"""
+    directory = st.session_state.pop('attachment_dir', None)
+    st.session_state.pop('attachments', None)
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+
 def show_step_review_send(email_service, template_service):
     """Step 4: Review and send"""
     st.subheader("🚀 Review & Send Campaign")
     
+    if 'active_campaign_id' in st.session_state:
+        show_campaign_progress(st.session_state.active_campaign_id)
+        return
+    
     # Get data from session
     campaign_name = st.session_state.campaign_name
     subject = st.session_state.subject
     template = st.session_state.selected_template
     recipients = st.session_state.recipients
     field_values = st.session_state.field_values
+    attachments = st.session_state.get('attachments', [])
     
     # Summary
     st.markdown("### 📋 Campaign Summary")
@@ -246,6 +343,9 @@ def show_step_review_send(email_service, template_service):
         st.write(f"**Template:** {template.name}")
         st.write(f"**Recipients:** {len(recipients)}")
     
+    if attachments:
+        st.write(f"**Attachments:** {', '.join(os.path.basename(path) for path in attachments)}")
+    
     # Test email
     st.markdown("### 🧪 Send Test Email")
     test_email = st.text_input("Test Email Address", placeholder="your@email.com")
@@ -254,15 +354,15 @@ def show_step_review_send(email_service, template_service):
         if test_email:
             with st.spinner("Sending test email..."):
                 # Prepare test data
-                test_data = recipients[0].copy()
+                test_data = dict(recipients[0])
                 test_data.update(field_values)
                 test_data = CSVParser.create_sample_data(test_data)
                 test_data['email'] = test_email
                 
                 test_html = template_service.render_template(template.html_content, test_data)
-                test_subject = subject.format(**test_data)
+                test_subject = template_service.compile_template(subject).render(test_data)
                 
-                success, error = email_service.send_test_email(test_email, test_subject, test_html)
+                success, error = email_service.send_test_email(test_email, test_subject, test_html, attachments)
                 
                 if success:
                     st.success(f"✅ Test email sent to {test_email}")
@@ -274,6 +374,7 @@ def show_step_review_send(email_service, template_service):
     # Send campaign
     st.markdown("### 📤 Send Campaign")
     st.warning(f"⚠️ This will send {len(recipients)} emails. This action cannot be undone.")
+    st.caption("The campaign is sent by a background worker, so it keeps going if you close or refresh this page.")
     
     col1, col2 = st.columns(2)
     
@@ -284,92 +385,103 @@ def show_step_review_send(email_service, template_service):
     
     with col2:
         if st.button("🚀 Send Campaign", type="primary", use_container_width=True):
-            send_campaign(email_service, template_service, campaign_name, subject, template, recipients, field_values)
+            send_campaign(email_service, template_service, campaign_name, subject, template, recipients, field_values, attachments)
 
-def send_campaign(email_service, template_service, campaign_name, subject, template, recipients, field_values):
-    """Send the email campaign"""
-    # Create campaign in database
+def send_campaign(email_service, template_service, campaign_name, subject, template, recipients, field_values, attachments):
+    """Queue the email campaign for a background worker"""
     campaign = Campaign(
         name=campaign_name,
         subject=subject,
         template_id=template.template_id,
-        recipients_count=len(recipients),
-        status='sending'
-    )
-    
-    campaign_id = mongodb.campaigns.insert_one(campaign.to_dict()).inserted_id
-    
-    # Progress bar
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    sent_count = 0
-    failed_count = 0
-    
-    # Prepare template
-    html_template = template.html_content
-    
-    # Add field values as defaults
-    for recipient in recipients:
-        for key, value in field_values.items():
-            if key not in recipient or not recipient[key]:
-                recipient[key] = value
-        # Add sample data defaults
-        recipient.update(CSVParser.create_sample_data(recipient))
-    
-    # Send emails
-    def progress_callback(current, total, message):
-        progress = current / total
-        progress_bar.progress(progress)
-        status_text.text(f"Progress: {current}/{total} - {message}")
-    
-    results = email_service.send_bulk_emails(
-        recipients=recipients,
-        subject=subject,
-        html_template=html_template,
-        progress_callback=progress_callback
+        recipients_count=len(recipients)
     )
     
-    # Log each email
-    for recipient in recipients:
-        email_log = EmailLog(
-            campaign_id=str(campaign_id),
-            recipient_email=recipient['email'],
-            recipient_data=recipient,
-            status='sent' if recipient['email'] not in [e['email'] for e in results['errors']] else 'failed',
-            error_message=next((e['error'] for e in results['errors'] if e['email'] == recipient['email']), None)
-        )
-        mongodb.email_logs.insert_one(email_log.to_dict())
-    
-    # Update campaign
-    mongodb.campaigns.update_one(
-        {'_id': campaign_id},
-        {
-            '$set': {
-                'status': 'completed',
-                'sent_count': results['sent_count'],
-                'failed_count': results['failed_count']
-            }
-        }
+    campaign_id = CampaignQueue().enqueue(
+        campaign,
+        recipients,
+        html_template=template.html_content,
+        field_values=field_values,
+        attachments=attachments
     )
+    # The queue holds its own copies in GridFS
+    discard_attachments()
     
-    # Show results
-    progress_bar.empty()
-    status_text.empty()
-    
-    st.success(f"✅ Campaign completed!")
-    st.write(f"**Sent:** {results['sent_count']}")
-    st.write(f"**Failed:** {results['failed_count']}")
-    
-    if results['errors']:
-        with st.expander("View Errors"):
-            for error in results['errors']:
-                st.write(f"- {error['email']}: {error['error']}")
+    st.session_state.active_campaign_id = campaign_id
+    st.rerun()
+
+def show_campaign_progress(campaign_id):
+    """Poll a queued campaign until its worker finishes it"""
+    queue = CampaignQueue()
+    campaign = queue.get(campaign_id)
+    
+    if campaign is None:
+        st.error("Campaign not found.")
+    else:
+        progress = campaign.get('progress') or {}
+        completed = progress.get('completed', 0)
+        total = progress.get('total') or campaign['recipients_count']
+        
+        st.subheader(f"📤 {campaign['name']}")
+        st.progress(completed / total if total else 1.0)
+        st.text(f"Progress: {completed}/{total} - {progress.get('message', '')}")
+        st.write(f"**Sent:** {campaign.get('sent_count', 0)} · **Failed:** {campaign.get('failed_count', 0)}")
+        
+        if campaign['status'] in ACTIVE_STATUSES:
+            if campaign.get('control'):
+                st.info(f"⏸️ Stopping the campaign ({campaign['control']} requested)...")
+            elif campaign['status'] == 'queued':
+                st.info("⏳ Waiting for a campaign worker. Start one with `python -m services.campaign_worker`.")
+            else:
+                st.info("The campaign is sending in the background. You can close this page.")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("⏸️ Pause", use_container_width=True):
+                    queue.request_control(campaign_id, 'pause')
+            with col2:
+                if st.button("⏹️ Cancel", use_container_width=True):
+                    queue.request_control(campaign_id, 'cancel')
+            
+            time.sleep(Config.CAMPAIGN_PROGRESS_INTERVAL)
+            st.rerun()
+        
+        if campaign['status'] == 'paused':
+            st.warning("⏸️ Campaign paused. Recipients already sent will not be sent again.")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("▶️ Resume", type="primary", use_container_width=True):
+                    queue.resume(campaign_id)
+                    st.rerun()
+            with col2:
+                if st.button("⏹️ Cancel", use_container_width=True):
+                    queue.request_control(campaign_id, 'cancel')
+                    st.rerun()
+        elif campaign['status'] in ('completed', 'cancelled'):
+            if campaign['status'] == 'completed':
+                st.success(f"✅ Campaign completed!")
+            else:
+                st.warning("⏹️ Campaign cancelled.")
+            
+            failed_logs = list(mongodb.email_logs.find(
+                {'campaign_id': campaign_id, 'status': 'failed'},
+                {'recipient_email': 1, 'error_message': 1}
+            ).limit(100))
+            if failed_logs:
+                with st.expander("View Errors"):
+                    for log in failed_logs:
+                        st.write(f"- {log['recipient_email']}: {log['error_message']}")
+        else:
+            st.error(f"❌ Campaign {campaign['status']}: {campaign.get('error', 'unknown error')}")
+            if st.button("▶️ Resume", type="primary"):
+                queue.resume(campaign_id)
+                st.rerun()
     
     # Reset wizard
     if st.button("Create Another Campaign"):
-        for key in ['campaign_step', 'recipients_df', 'recipients', 'selected_template', 
-                    'campaign_name', 'subject', 'field_values']:
+        discard_attachments()
+        for key in ['campaign_step', 'recipients', 'selected_template', 
+                    'campaign_name', 'subject', 'field_values', 'attachments', 'active_campaign_id',
+                    'upload_key', 'upload_parsed']:
             if key in st.session_state:
                 del st.session_state[key]
         st.rerun()
@@ -51,7 +51,7 @@ def show_templates_list(template_service):
             with st.container():
                 st.markdown("**Preview:**")
                 sample_data = {var: f"{{{var}}}" for var in template.variables}
-                st.markdown(template.html_content.format(**sample_data), unsafe_allow_html=True)
+                st.markdown(template_service.compile_template(template.html_content).render(sample_data), unsafe_allow_html=True)
             
             # Actions
             col1, col2 = st.columns(2)
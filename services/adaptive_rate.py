@@ -0,0 +1,100 @@
+import smtplib
+import threading
+import time
+from typing import Optional
+import aiosmtplib
+from .rate_limiter import TokenBucket
+
+# SMTP replies that mean "slow down / try again later"
+THROTTLE_CODES = {421, 450, 451, 452, 454}
+
+# Permanent replies about the recipient or message rather than the sender
+RECIPIENT_CODES = {501, 550, 551, 552, 553}
+
+
+def smtp_error_code(error: BaseException) -> Optional[int]:
+    """Extract the SMTP reply code from a send exception, if it carries one"""
+    while error is not None:
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            codes = [code for code, _ in error.recipients.values()]
+            return codes[0] if codes else None
+        if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+            codes = [refusal.code for refusal in error.recipients]
+            return codes[0] if codes else None
+        code = getattr(error, 'smtp_code', None) or getattr(error, 'code', None)
+        if isinstance(code, int):
+            return code
+        error = error.__cause__
+    return None
+
+
+def is_transient(code: Optional[int], disconnected: bool = False) -> bool:
+    """Check whether a failed send should be slowed down and retried"""
+    return disconnected or code in THROTTLE_CODES
+
+
+def is_sender_fault(code: Optional[int]) -> bool:
+    """Check whether a failure points at the sender account or relay, not the recipient"""
+    return code not in RECIPIENT_CODES
+
+
+class AdaptiveRateController:
+    """
+    AIMD send-rate control for a token bucket
+
+    Every successful send raises the rate additively (about `increase`
+    emails/minute per minute of clean sending). A throttling or transient
+    reply multiplies the rate by `decrease_factor` and pauses the bucket
+    for `cooldown` seconds.
+    """
+
+    def __init__(
+        self,
+        limiter: TokenBucket,
+        min_per_minute: float,
+        max_per_minute: float,
+        increase: float = 1,
+        decrease_factor: float = 0.5,
+        cooldown: float = 30
+    ):
+        self.limiter = limiter
+        self.min_per_minute = min_per_minute
+        self.max_per_minute = max(max_per_minute, min_per_minute)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate_per_minute(self) -> float:
+        """Send rate currently in effect"""
+        return self.limiter.rate * 60
+
+    def _set_rate(self, per_minute: float):
+        per_minute = min(self.max_per_minute, max(self.min_per_minute, per_minute))
+        self.limiter.set_rate(per_minute / 60)
+
+    def on_success(self):
+        """Additive increase, skipped while cooling down"""
+        with self._lock:
+            if time.monotonic() < self._cooldown_until:
+                return
+            current = self.rate_per_minute
+            self._set_rate(current + self.increase / current)
+
+    def on_throttle(self) -> float:
+        """
+        Multiplicative decrease and cooldown
+
+        Returns:
+            Cooldown in seconds (0 if a cooldown is already running)
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._cooldown_until:
+                return 0
+            self._cooldown_until = now + self.cooldown
+            self._set_rate(self.rate_per_minute * self.decrease_factor)
+            self.limiter.pause(self.cooldown)
+            return self.cooldown
@@ -0,0 +1,178 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional
+import aiosmtplib
+from config import Config
+from .adaptive_rate import is_sender_fault, is_transient, smtp_error_code
+from .bulk_run import BulkSendRun
+from .render_cache import RenderCache
+from .template_service import compile_template
+
+# Marks the end of a pipeline queue
+_DONE = object()
+
+
+class AsyncBulkSender:
+    """
+    asyncio bulk sending pipeline
+
+    Rendering, MIME building and SMTP delivery run as separate stages
+    connected by bounded queues, so a slow SMTP stage applies backpressure
+    to rendering instead of buffering the whole campaign in memory. All
+    stages share one thread; delivery runs over many concurrent sessions.
+    """
+
+    def __init__(
+        self,
+        email_service,
+        sessions: Optional[int] = None,
+        queue_size: Optional[int] = None
+    ):
+        """
+        Args:
+            email_service: EmailService providing the sender shards and
+                message building
+            sessions: Number of concurrent SMTP sessions (in-flight sends)
+            queue_size: Capacity of each queue between stages
+        """
+        self.email_service = email_service
+        self.sessions = sessions or Config.ASYNC_SMTP_SESSIONS
+        self.queue_size = queue_size or Config.ASYNC_QUEUE_SIZE
+
+    @staticmethod
+    async def _quit(smtp: Optional[aiosmtplib.SMTP]):
+        """Close a session, ignoring errors from dropped connections"""
+        if smtp is None:
+            return
+        try:
+            await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    async def send(
+        self,
+        recipients: Iterable[Dict],
+        subject: str,
+        html_template: str,
+        progress_callback=None,
+        attachments: Optional[List[str]] = None,
+        on_result=None,
+        should_stop=None,
+        total: Optional[int] = None
+    ) -> Dict:
+        """
+        Send bulk emails through the pipeline
+
+        Takes the same arguments and returns the same results as
+        EmailService.send_bulk_emails. Transient failures go back through
+        the render stage.
+        """
+        results = {
+            'sent_count': 0,
+            'failed_count': 0,
+            'errors': []
+        }
+
+        run = BulkSendRun(
+            recipients, results, progress_callback, self.email_service.router,
+            on_result=on_result, should_stop=should_stop, total=total
+        )
+        renderer = RenderCache(compile_template(subject), compile_template(html_template))
+        skeleton = self.email_service.campaign_skeleton(attachments)
+        render_queue = asyncio.Queue(maxsize=self.queue_size)
+        send_queue = asyncio.Queue(maxsize=self.queue_size)
+        recorded = asyncio.Event()
+
+        async def render():
+            while True:
+                item = await run.next_item_async()
+                if item is None:
+                    if not run.outstanding:
+                        break
+                    # In-flight sends may still put retries back on the queue
+                    recorded.clear()
+                    await recorded.wait()
+                    continue
+                await render_queue.put((item, renderer.render(item[1])))
+            await render_queue.put(_DONE)
+
+        async def build():
+            while True:
+                entry = await render_queue.get()
+                if entry is _DONE:
+                    for _ in range(self.sessions):
+                        await send_queue.put(_DONE)
+                    return
+                item, message = entry
+                to_email = item[1]['email']
+                if to_email.isascii():
+                    payload = message.encoded
+                else:
+                    payload = self.email_service.build_message(
+                        to_email, message.subject, message.html, attachments
+                    )
+                await send_queue.put((item, payload))
+
+        async def deliver():
+            # One session per shard: shard name -> [smtp, messages sent]
+            sessions = {}
+            try:
+                while True:
+                    entry = await send_queue.get()
+                    if entry is _DONE:
+                        return
+                    item, payload = entry
+
+                    # Pick the shard at delivery time so benched shards are skipped
+                    shard = run.router.choose()
+                    if shard is None:
+                        run.record_no_sender(*item)
+                        recorded.set()
+                        continue
+                    to_email = item[1]['email']
+
+                    await run.acquire_async(shard)
+
+                    session = sessions.setdefault(shard.name, [None, 0])
+                    outcome = (False, None, False, False)
+                    for attempt in range(2):
+                        try:
+                            if session[0] is None or session[1] >= Config.SMTP_MAX_MESSAGES_PER_CONNECTION:
+                                await self._quit(session[0])
+                                session[:] = [None, 0]
+                                session[0] = await shard.connect_async()
+                            if isinstance(payload, tuple):
+                                raw = skeleton.assemble(shard.email, to_email, *payload)
+                                await session[0].sendmail(shard.email, [to_email], raw)
+                            else:
+                                payload.replace_header('From', shard.email)
+                                await session[0].send_message(payload)
+                            session[1] += 1
+                            outcome = (True, None, False, False)
+                            break
+                        except aiosmtplib.SMTPServerDisconnected as e:
+                            session[:] = [None, 0]
+                            outcome = (False, str(e), True, True)
+                        except Exception as e:
+                            code = smtp_error_code(e)
+                            outcome = (False, str(e), is_transient(code), is_sender_fault(code))
+                            break
+
+                    run.record(*item, shard, *outcome)
+                    recorded.set()
+            finally:
+                for smtp, _ in sessions.values():
+                    await self._quit(smtp)
+
+        tasks = [asyncio.create_task(render()), asyncio.create_task(build())]
+        tasks += [asyncio.create_task(deliver()) for _ in range(self.sessions)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        run.finish()
+        results['render_cache'] = renderer.stats()
+        return results
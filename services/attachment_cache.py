@@ -0,0 +1,121 @@
+import base64
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from email.mime.base import MIMEBase
+from email.utils import encode_rfc2231
+from typing import List, Tuple
+from config import Config
+
+CRLF = b'\r\n'
+
+# Input bytes per encoded chunk: a whole number of 57-byte base64 lines
+_CHUNK_SIZE = 57 * 1024
+
+
+class CachedAttachment:
+    """
+    Attachment file encoded once into an immutable MIME part
+
+    `headers` and `body` are the part's header block and base64 body with
+    CRLF line endings, ready to be spliced into raw messages.
+    """
+
+    __slots__ = ('path', 'filename', 'size', 'headers', 'body', '_payload')
+
+    def __init__(self, path: str, filename: str, size: int, headers: bytes, body: bytes):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.headers = headers
+        self.body = body
+        self._payload = None
+
+    def mime_part(self) -> MIMEBase:
+        """Fresh MIMEBase part carrying the cached base64 payload, for the email package path"""
+        if self._payload is None:
+            self._payload = self.body.decode('ascii')
+        part = MIMEBase('application', 'octet-stream')
+        part['Content-Transfer-Encoding'] = 'base64'
+        part['Content-Disposition'] = content_disposition(self.filename)
+        part.set_payload(self._payload)
+        return part
+
+
+def content_disposition(filename: str) -> str:
+    """Content-Disposition value for an attachment, RFC 2231-encoding non-ASCII names"""
+    filename = ' '.join(filename.splitlines())
+    if filename.isascii():
+        quoted = filename.replace('\\', '\\\\').replace('"', '\\"')
+        return f'attachment; filename="{quoted}"'
+    return f"attachment; filename*={encode_rfc2231(filename, 'utf-8')}"
+
+
+def _encode_file(path: str, size: int) -> bytes:
+    """
+    Base64-encode a file into 76-character CRLF lines
+
+    Files above Config.ATTACHMENT_MMAP_THRESHOLD are memory-mapped and
+    encoded chunk by chunk instead of being read into memory in one go.
+    """
+    with open(path, 'rb') as f:
+        if not size or size < Config.ATTACHMENT_MMAP_THRESHOLD:
+            return base64.encodebytes(f.read()).replace(b'\n', CRLF)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                chunks = [
+                    base64.encodebytes(view[offset:offset + _CHUNK_SIZE]).replace(b'\n', CRLF)
+                    for offset in range(0, len(view), _CHUNK_SIZE)
+                ]
+            finally:
+                view.release()
+    return b''.join(chunks)
+
+
+def _encode_attachment(path: str, size: int) -> CachedAttachment:
+    filename = os.path.basename(path)
+    headers = (
+        b'Content-Type: application/octet-stream' + CRLF
+        + b'MIME-Version: 1.0' + CRLF
+        + b'Content-Transfer-Encoding: base64' + CRLF
+        + b'Content-Disposition: ' + content_disposition(filename).encode('ascii') + CRLF
+    )
+    # An empty body still needs the line break that ends the part
+    return CachedAttachment(path, filename, size, headers, _encode_file(path, size) or CRLF)
+
+
+_attachment_cache: 'OrderedDict[Tuple[str, int, int], CachedAttachment]' = OrderedDict()
+_attachment_cache_lock = threading.Lock()
+
+
+def load_attachment(path: str) -> CachedAttachment:
+    """
+    Encoded attachment for a file, memoized in an LRU keyed by path, mtime and size
+
+    A file that changes on disk gets a new key and is encoded again.
+
+    Raises:
+        OSError: If the file cannot be read
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _attachment_cache_lock:
+        cached = _attachment_cache.get(key)
+        if cached is not None:
+            _attachment_cache.move_to_end(key)
+            return cached
+
+    cached = _encode_attachment(path, stat.st_size)
+    with _attachment_cache_lock:
+        _attachment_cache[key] = cached
+        while len(_attachment_cache) > Config.ATTACHMENT_CACHE_SIZE:
+            _attachment_cache.popitem(last=False)
+    return cached
+
+
+def load_attachments(paths: List[str]) -> List[CachedAttachment]:
+    """Encoded attachments for a list of file paths"""
+    return [load_attachment(path) for path in paths]
@@ -0,0 +1,87 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional
+from gridfs.errors import NoFile
+from database import mongodb
+
+
+class AttachmentStore:
+    """
+    Attachments of queued campaigns, kept in MongoDB GridFS
+
+    Jobs reference their files by GridFS id instead of by a path on the web
+    server, so a worker on any host, or a resume after the uploader's temp
+    directory is gone, can still send them. A worker downloads each file once
+    into a private directory of its own process and sends from there, so
+    the attachment cache keeps encoding it only once.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or mongodb
+        self._directory = None
+        self._lock = threading.Lock()
+
+    def save(self, paths: List[str]) -> List[Dict]:
+        """
+        Upload files for a queued campaign
+
+        Returns:
+            One {'file_id', 'filename'} reference per file, to store in the job
+        """
+        references = []
+        for path in paths:
+            filename = os.path.basename(path)
+            with open(path, 'rb') as f:
+                file_id = self.db.attachments.upload_from_stream(filename, f)
+            references.append({'file_id': file_id, 'filename': filename})
+        return references
+
+    def _local_directory(self) -> str:
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix='emailer_worker_attachments_')
+                atexit.register(shutil.rmtree, self._directory, True)
+            return self._directory
+
+    def _local_path(self, reference: Dict) -> str:
+        return os.path.join(self._local_directory(), str(reference['file_id']), reference['filename'])
+
+    def local_paths(self, references: Optional[List]) -> List[str]:
+        """
+        Paths of a job's attachments on this host, downloading files not fetched yet
+
+        Plain paths (jobs queued before attachments were stored in GridFS)
+        are returned as they are.
+
+        Raises:
+            gridfs.errors.NoFile: If a file was deleted from GridFS
+        """
+        paths = []
+        for reference in references or []:
+            if isinstance(reference, str):
+                paths.append(reference)
+                continue
+            path = self._local_path(reference)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                partial = f"{path}.part"
+                with open(partial, 'wb') as f:
+                    self.db.attachments.download_to_stream(reference['file_id'], f)
+                os.replace(partial, path)
+            paths.append(path)
+        return paths
+
+    def delete(self, references: Optional[List]):
+        """Remove a finished campaign's files from GridFS and this host"""
+        for reference in references or []:
+            if isinstance(reference, str):
+                continue
+            try:
+                self.db.attachments.delete(reference['file_id'])
+            except NoFile:
+                pass
+            if self._directory is not None:
+                shutil.rmtree(os.path.dirname(self._local_path(reference)), ignore_errors=True)
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from typing import Callable, Dict, Iterable, Optional
+from config import Config
+from .domain_scheduler import DomainScheduler
+from .sender_shards import SenderShard, ShardRouter
+
+# Error recorded when every sender account has used up its daily quota
+NO_SENDER_ERROR = "No sender account available (daily quotas exhausted)"
+
+
+class BulkSendRun:
+    """
+    Bookkeeping for one bulk send
+
+    Hands out recipients interleaved by destination domain under the
+    per-domain caps of a DomainScheduler (retries first within their
+    domain), paces each message through the rate limiter of the shard
+    chosen for it, feeds outcomes back to the shard, requeues transient
+    failures and reports progress.
+    Used from a single thread: the calling thread for the sync paths, the
+    event loop for asyncio.
+
+    `on_result(index, recipient, success, error)` is called once per
+    recipient with its final outcome, as soon as it is known.
+    `recipients` may be any iterable, e.g. a generator streaming them from
+    disk; it is read at most Config.DOMAIN_LOOKAHEAD recipients ahead of
+    the send. Pass `total` for progress reporting when it has no length;
+    without either, progress_callback gets None as the total.
+    `should_stop()` is checked before each message is handed out; once it
+    returns True no new messages start, and recipients not yet sent (including
+    queued retries) get no outcome.
+    """
+
+    def __init__(
+        self,
+        recipients: Iterable[Dict],
+        results: Dict,
+        progress_callback,
+        router: ShardRouter,
+        max_retries: Optional[int] = None,
+        on_result: Optional[Callable] = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+        total: Optional[int] = None,
+        domain_concurrency: bool = True
+    ):
+        self.results = results
+        self.progress_callback = progress_callback
+        self.router = router
+        self.max_retries = Config.SEND_MAX_RETRIES if max_retries is None else max_retries
+        self.on_result = on_result
+        self.should_stop = should_stop
+        self.stopped = False
+
+        if total is None and hasattr(recipients, '__len__'):
+            total = len(recipients)
+        self.total = total
+        self.completed = 0
+        self.outstanding = 0
+        self._scheduler = DomainScheduler(enumerate(recipients), cap_concurrency=domain_concurrency)
+        self._errors = []
+        self._handled_by = {}
+
+    @property
+    def rate_per_minute(self) -> float:
+        """Combined send rate currently in effect"""
+        return self.router.rate_per_minute
+
+    def _progress(self, message: str):
+        if self.progress_callback:
+            self.progress_callback(self.completed, self.total, message)
+
+    def _on_wait(self, wait_time: float):
+        if wait_time >= 1:
+            self._progress(f"Rate limit reached. Waiting {int(wait_time)}s...")
+
+    def next_item(self) -> Optional[tuple]:
+        """
+        Next (index, recipient, attempt) to send, or None if nothing is queued
+
+        None does not mean the run is over while sends are outstanding:
+        they may still put retries back on the queue, and recipients whose
+        domain is at its concurrency cap wait for those sends to finish.
+        Sleeps while every queued domain is waiting on its rate cap.
+        """
+        while True:
+            item, wait_time = self._take()
+            if not wait_time:
+                return item
+            self._on_wait(wait_time)
+            time.sleep(wait_time)
+
+    async def next_item_async(self) -> Optional[tuple]:
+        """Async version of next_item that yields to the event loop while waiting"""
+        while True:
+            item, wait_time = self._take()
+            if not wait_time:
+                return item
+            self._on_wait(wait_time)
+            await asyncio.sleep(wait_time)
+
+    def _take(self) -> tuple:
+        """(item or None, seconds until a rate-capped domain can send) from the scheduler"""
+        if self.stopped or (self.should_stop and self.should_stop()):
+            self.stopped = True
+            return None, 0.0
+        item, wait_time = self._scheduler.next()
+        if item is not None:
+            self.outstanding += 1
+        return item, wait_time
+
+    def acquire(self, shard: SenderShard):
+        """Wait for a send slot on the shard"""
+        shard.limiter.acquire(on_wait=self._on_wait)
+
+    async def acquire_async(self, shard: SenderShard):
+        """Wait for a send slot without blocking the event loop"""
+        await shard.limiter.acquire_async(on_wait=self._on_wait)
+
+    def record(
+        self,
+        index: int,
+        recipient: Dict,
+        attempt: int,
+        shard: Optional[SenderShard],
+        success: bool,
+        error: Optional[str],
+        transient: bool = False,
+        sender_fault: bool = False
+    ):
+        """Record a send outcome, requeueing transient failures"""
+        self.outstanding -= 1
+        self._scheduler.release(recipient)
+        cooldown = shard.record(success, transient, sender_fault) if shard else 0
+
+        # Sender faults are retried on another shard when there is one
+        retryable = transient or (sender_fault and len(self.router.shards) > 1)
+        if not success and retryable and attempt < self.max_retries:
+            self._scheduler.add_retry((index, recipient, attempt + 1))
+            message = f"Deferred {recipient['email']}: {error}. Retrying at {self.rate_per_minute:.1f}/min"
+            if cooldown:
+                message += f" after {int(cooldown)}s cooldown"
+            self._progress(message)
+            return
+
+        if success:
+            self.results['sent_count'] += 1
+        else:
+            self.results['failed_count'] += 1
+            self._errors.append((index, {'email': recipient['email'], 'error': error}))
+        if shard:
+            self._handled_by[recipient['email']] = shard.name
+        if self.on_result:
+            self.on_result(index, recipient, success, error)
+
+        self.completed += 1
+        self._progress(f"Sent to {recipient['email']} ({self.rate_per_minute:.1f}/min)")
+
+    def record_no_sender(self, index: int, recipient: Dict, attempt: int):
+        """Fail a message because no sender account can take it"""
+        self.record(index, recipient, attempt, None, False, NO_SENDER_ERROR)
+
+    def finish(self):
+        """Store errors in recipient order, shard assignments, the final send rate and whether the run was stopped"""
+        self._errors.sort(key=lambda item: item[0])
+        self.results['errors'] = [error for _, error in self._errors]
+        self.results['handled_by'] = self._handled_by
+        self.results['rate_per_minute'] = round(self.rate_per_minute, 1)
+        self.results['stopped'] = self.stopped
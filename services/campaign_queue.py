@@ -0,0 +1,279 @@
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from config import Config
+from database import mongodb
+from models import Campaign
+from .attachment_store import AttachmentStore
+from .stats_service import StatsService
+
+# Campaign statuses that a worker may still pick up or is working on
+ACTIVE_STATUSES = ('queued', 'sending')
+
+# Campaign statuses that can be resumed
+RESUMABLE_STATUSES = ('paused', 'failed')
+
+# Control requests a running campaign's worker acts on, and the status each leads to
+CONTROL_STATUSES = {'pause': 'paused', 'cancel': 'cancelled'}
+
+# Recipients are inserted, and read back for sending, in batches of this many documents
+_INSERT_BATCH_SIZE = 1000
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class CampaignQueue:
+    """
+    Durable campaign job queue stored in MongoDB
+
+    A queued campaign is a document in `campaigns` with status 'queued'
+    that also carries the template, field values and references to its
+    attachments, which are stored in GridFS (see AttachmentStore); its
+    recipients live in `campaign_recipients`. A worker claims a job by
+    atomically flipping it to 'sending' under a lease it keeps renewing.
+    Jobs whose lease runs out (a dead worker) are claimed again.
+
+    Each recipient document carries its own status ('pending', 'sent' or
+    'failed') and an idempotency key, and is checkpointed as soon as its
+    outcome is known, so a claimed or resumed job only sends to recipients
+    that are still pending.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or mongodb
+        self.attachments = AttachmentStore(self.db)
+
+    def enqueue(
+        self,
+        campaign: Campaign,
+        recipients: Iterable[Dict],
+        html_template: str,
+        field_values: Optional[Dict] = None,
+        attachments: Optional[List[str]] = None
+    ) -> str:
+        """
+        Store a campaign and its recipients for a worker to send
+
+        `recipients` may be any iterable, e.g. CSVParser.iter_recipients
+        streaming a file; it is inserted a batch at a time. The campaign stays
+        a draft until every recipient is stored, so no worker starts it early.
+        Attachment files are uploaded to GridFS, so workers on any host can
+        read them.
+
+        Returns:
+            The campaign id
+        """
+        document = campaign.to_dict()
+        document.update({
+            'status': 'draft',
+            'html_template': html_template,
+            'field_values': field_values or {},
+            'attachments': self.attachments.save(attachments or []),
+            'progress': {'completed': 0, 'total': 0, 'message': 'Storing recipients'}
+        })
+        campaign_id = str(self.db.campaigns.insert_one(document).inserted_id)
+        StatsService(self.db).record_campaign()
+
+        recipients = iter(recipients)
+        count = 0
+        while True:
+            batch = list(islice(recipients, _INSERT_BATCH_SIZE))
+            if not batch:
+                break
+            self.db.campaign_recipients.insert_many([
+                {
+                    'campaign_id': campaign_id,
+                    'index': count + offset,
+                    'email': recipient['email'],
+                    'data': dict(recipient),
+                    'status': 'pending',
+                    'idempotency_key': f"{campaign_id}:{count + offset}"
+                }
+                for offset, recipient in enumerate(batch)
+            ])
+            count += len(batch)
+
+        self.db.campaigns.update_one(
+            {'_id': ObjectId(campaign_id)},
+            {'$set': {
+                'status': 'queued',
+                'recipients_count': count,
+                'progress': {'completed': 0, 'total': count, 'message': 'Waiting for a worker'}
+            }}
+        )
+        return campaign_id
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """Claim the oldest queued (or abandoned) campaign, or None if there is none"""
+        now = _now()
+        return self.db.campaigns.find_one_and_update(
+            {'$or': [
+                {'status': 'queued'},
+                {'status': 'sending', 'lease_expires_at': {'$lt': now}}
+            ]},
+            {'$set': {
+                'status': 'sending',
+                'worker_id': worker_id,
+                'lease_expires_at': now + timedelta(seconds=Config.WORKER_LEASE_SECONDS),
+                'started_at': now
+            }},
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _update_owned(self, campaign_id: str, worker_id: str, update: Dict) -> bool:
+        """Apply an update only while the worker still holds the job"""
+        result = self.db.campaigns.update_one(
+            {'_id': ObjectId(campaign_id), 'worker_id': worker_id, 'status': 'sending'},
+            update
+        )
+        return result.matched_count == 1
+
+    def renew_lease(self, campaign_id: str, worker_id: str) -> bool:
+        """
+        Extend the worker's lease on a job
+
+        Returns:
+            False if the job was taken over or is no longer sending
+        """
+        return self._update_owned(campaign_id, worker_id, {'$set': {
+            'lease_expires_at': _now() + timedelta(seconds=Config.WORKER_LEASE_SECONDS)
+        }})
+
+    def report_progress(self, campaign_id: str, worker_id: str, completed: int, total: int, message: str) -> bool:
+        """Publish send progress for the UI to poll"""
+        return self._update_owned(campaign_id, worker_id, {'$set': {
+            'progress': {'completed': completed, 'total': total, 'message': message}
+        }})
+
+    def finish(self, campaign_id: str, worker_id: str, status: str) -> bool:
+        """
+        Mark a job completed, paused or cancelled, with counts over all its recipients
+
+        Completed and cancelled jobs are never sent again, so their
+        attachments are deleted.
+        """
+        finished = self._update_owned(campaign_id, worker_id, {
+            '$set': {
+                'status': status,
+                'sent_count': self.db.campaign_recipients.count_documents(
+                    {'campaign_id': campaign_id, 'status': 'sent'}
+                ),
+                'failed_count': self.db.campaign_recipients.count_documents(
+                    {'campaign_id': campaign_id, 'status': 'failed'}
+                ),
+                'finished_at': _now()
+            },
+            '$unset': {'lease_expires_at': '', 'control': ''}
+        })
+        if finished and status in ('completed', 'cancelled'):
+            self._delete_attachments(campaign_id)
+        return finished
+
+    def _delete_attachments(self, campaign_id: str):
+        campaign = self.db.campaigns.find_one({'_id': ObjectId(campaign_id)}, {'attachments': 1})
+        if campaign:
+            self.attachments.delete(campaign.get('attachments'))
+
+    def fail(self, campaign_id: str, worker_id: str, error: str) -> bool:
+        """Mark a job failed"""
+        return self._update_owned(campaign_id, worker_id, {
+            '$set': {'status': 'failed', 'error': error, 'finished_at': _now()},
+            '$unset': {'lease_expires_at': ''}
+        })
+
+    def release(self, campaign_id: str, worker_id: str) -> bool:
+        """Put a job back on the queue, e.g. when its worker shuts down"""
+        return self._update_owned(campaign_id, worker_id, {
+            '$set': {'status': 'queued'},
+            '$unset': {'worker_id': '', 'lease_expires_at': ''}
+        })
+
+    def pending_count(self, campaign_id: str) -> int:
+        """Number of recipients not yet sent or failed"""
+        return self.db.campaign_recipients.count_documents({'campaign_id': campaign_id, 'status': 'pending'})
+
+    def pending_recipients(self, campaign_id: str) -> Iterator[Dict]:
+        """
+        Recipient documents not yet sent or failed, in upload order
+
+        Read a batch at a time with keyset pagination on the index, so a
+        long send neither holds every recipient nor keeps a cursor open.
+        """
+        after = -1
+        while True:
+            batch = list(self.db.campaign_recipients.find(
+                {'campaign_id': campaign_id, 'status': 'pending', 'index': {'$gt': after}},
+                {'_id': 0, 'index': 1, 'data': 1, 'idempotency_key': 1}
+            ).sort('index', 1).limit(_INSERT_BATCH_SIZE))
+            yield from batch
+            if len(batch) < _INSERT_BATCH_SIZE:
+                return
+            after = batch[-1]['index']
+
+    def checkpoint(self, campaign_id: str, index: int, success: bool, error: Optional[str]):
+        """Record a recipient's final outcome so it is never sent again"""
+        self.db.campaign_recipients.update_one(
+            {'campaign_id': campaign_id, 'index': index},
+            {'$set': {'status': 'sent' if success else 'failed', 'error': error, 'sent_at': _now()}}
+        )
+
+    def control(self, campaign_id: str) -> Optional[str]:
+        """Pending control request ('pause' or 'cancel') for a campaign"""
+        campaign = self.db.campaigns.find_one({'_id': ObjectId(campaign_id)}, {'control': 1})
+        return campaign.get('control') if campaign else None
+
+    def request_control(self, campaign_id: str, action: str) -> bool:
+        """
+        Pause or cancel a campaign
+
+        A queued campaign changes status at once; a sending one is stopped
+        by its worker before the next message.
+        """
+        if action not in CONTROL_STATUSES:
+            raise ValueError(f"Unknown campaign control: {action}")
+        result = self.db.campaigns.update_one(
+            {'_id': ObjectId(campaign_id), 'status': 'queued'},
+            {'$set': {'status': CONTROL_STATUSES[action]}}
+        )
+        if result.matched_count:
+            if action == 'cancel':
+                self._delete_attachments(campaign_id)
+            return True
+        result = self.db.campaigns.update_one(
+            {'_id': ObjectId(campaign_id), 'status': 'sending'},
+            {'$set': {'control': action}}
+        )
+        if result.matched_count:
+            return True
+        # A paused campaign can still be cancelled
+        result = self.db.campaigns.update_one(
+            {'_id': ObjectId(campaign_id), 'status': 'paused'},
+            {'$set': {'status': CONTROL_STATUSES[action]}}
+        )
+        if result.matched_count and action == 'cancel':
+            self._delete_attachments(campaign_id)
+        return result.matched_count == 1
+
+    def resume(self, campaign_id: str) -> bool:
+        """Queue a paused or failed campaign again; only its pending recipients are sent"""
+        result = self.db.campaigns.update_one(
+            {'_id': ObjectId(campaign_id), 'status': {'$in': list(RESUMABLE_STATUSES)}},
+            {
+                '$set': {'status': 'queued'},
+                '$unset': {'worker_id': '', 'control': '', 'error': ''}
+            }
+        )
+        return result.matched_count == 1
+
+    def get(self, campaign_id: str) -> Optional[Dict]:
+        """Status and progress of a campaign"""
+        return self.db.campaigns.find_one(
+            {'_id': ObjectId(campaign_id)},
+            {'name': 1, 'status': 1, 'control': 1, 'progress': 1, 'sent_count': 1,
+             'failed_count': 1, 'recipients_count': 1, 'error': 1}
+        )
@@ -0,0 +1,221 @@
+"""
+Background campaign worker
+
+Claims queued campaigns from MongoDB and sends them outside the Streamlit
+process, checkpointing every recipient so a paused, failed or interrupted
+campaign resumes where it stopped. Run one or more workers with:
+
+    python -m services.campaign_worker [--once]
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+from typing import Dict, Optional
+from config import Config
+from database import mongodb
+from models import EmailLog
+from utils import MergeContext
+from .campaign_queue import CONTROL_STATUSES, CampaignQueue
+from .email_service import EmailService
+from .log_buffer import EmailLogBuffer
+
+
+class CampaignWorker:
+    """Claims and sends queued campaigns, one at a time"""
+
+    def __init__(self, queue: Optional[CampaignQueue] = None, email_service: Optional[EmailService] = None):
+        self.queue = queue or CampaignQueue()
+        self.email_service = email_service or EmailService()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _monitor(
+        self,
+        campaign_id: str,
+        logs: EmailLogBuffer,
+        stop: threading.Event,
+        done: threading.Event,
+        state: Dict
+    ):
+        """
+        Poll for pause/cancel requests, renew the job lease and flush due logs until done
+
+        Sets `stop` when a control request arrives or the lease is lost, so
+        the send loop stops before its next message. Failed checks are
+        retried on the next tick; a lease that could not be renewed for two
+        thirds of its length also stops the send while it still holds.
+        """
+        renew_every = Config.WORKER_LEASE_SECONDS / 3
+        last_renewal = time.monotonic()
+        while not done.wait(Config.CAMPAIGN_CONTROL_INTERVAL):
+            try:
+                logs.flush_if_due()
+            except Exception as e:
+                print(f"Failed to flush email logs for campaign {campaign_id}: {str(e)}")
+            control = None if stop.is_set() else self._control_requested(campaign_id)
+            if control:
+                state['control'] = control
+                stop.set()
+            if time.monotonic() - last_renewal < renew_every:
+                continue
+            try:
+                renewed = self.queue.renew_lease(campaign_id, self.worker_id)
+            except Exception as e:
+                print(f"Failed to renew the lease on campaign {campaign_id}: {str(e)}")
+                if time.monotonic() - last_renewal >= Config.WORKER_LEASE_SECONDS * 2 / 3:
+                    print(f"Stopping campaign {campaign_id} before its lease runs out")
+                    state['lease_lost'] = True
+                    stop.set()
+                    return
+                continue
+            if not renewed:
+                print(f"Lost the lease on campaign {campaign_id}")
+                state['lease_lost'] = True
+                stop.set()
+                return
+            last_renewal = time.monotonic()
+
+    def _control_requested(self, campaign_id: str) -> Optional[str]:
+        """Pending pause/cancel request, treating a failed check as none"""
+        try:
+            return self.queue.control(campaign_id)
+        except Exception as e:
+            print(f"Failed to check campaign {campaign_id} for pause/cancel requests: {str(e)}")
+            return None
+
+    def run_campaign(self, job: Dict, logs: EmailLogBuffer, stop: Optional[threading.Event] = None) -> str:
+        """
+        Send the pending recipients of a claimed campaign, checkpointing each outcome
+
+        Returns:
+            The status the campaign ended in
+        """
+        campaign_id = str(job['_id'])
+        # Field values and sample defaults, resolved once for the whole send
+        merge_context = MergeContext(job.get('field_values'))
+        remaining = self.queue.pending_count(campaign_id)
+        # Position in this run -> recipient document, until its outcome is recorded
+        in_flight = {}
+
+        def recipients():
+            for position, doc in enumerate(self.queue.pending_recipients(campaign_id)):
+                in_flight[position] = doc
+                yield merge_context.layer(doc['data'])
+
+        done_before = job['recipients_count'] - remaining
+        last_report = [0.0]
+
+        def progress_callback(current, total, message):
+            now = time.monotonic()
+            if now - last_report[0] >= Config.CAMPAIGN_PROGRESS_INTERVAL:
+                last_report[0] = now
+                self.queue.report_progress(
+                    campaign_id, self.worker_id, done_before + current, job['recipients_count'], message
+                )
+
+        def on_result(position, recipient, success, error):
+            doc = in_flight.pop(position)
+            # Checkpoint first: a recipient must never be sent twice, even if its log is lost
+            self.queue.checkpoint(campaign_id, doc['index'], success, error)
+            email_log = EmailLog(
+                campaign_id=campaign_id,
+                recipient_email=recipient['email'],
+                recipient_data=doc['data'],
+                status='sent' if success else 'failed',
+                error_message=error,
+                idempotency_key=doc['idempotency_key']
+            )
+            logs.add(email_log)
+
+        results = self.email_service.send_bulk_emails(
+            recipients=recipients(),
+            subject=job['subject'],
+            html_template=job['html_template'],
+            progress_callback=progress_callback,
+            attachments=self.queue.attachments.local_paths(job.get('attachments')),
+            on_result=on_result,
+            should_stop=stop.is_set if stop else None,
+            total=remaining
+        )
+
+        if results['stopped']:
+            return 'stopped'
+        total = job['recipients_count']
+        self.queue.report_progress(campaign_id, self.worker_id, total, total, "Campaign completed")
+        return 'completed'
+
+    def run_once(self) -> bool:
+        """
+        Claim and send one campaign
+
+        Returns:
+            False if there was nothing to claim
+        """
+        job = self.queue.claim(self.worker_id)
+        if job is None:
+            return False
+
+        campaign_id = str(job['_id'])
+        print(f"Sending campaign {campaign_id} ({job['name']})")
+        logs = EmailLogBuffer(campaign_id)
+        stop = threading.Event()
+        done = threading.Event()
+        state = {}
+        monitor = threading.Thread(target=self._monitor, args=(campaign_id, logs, stop, done, state), daemon=True)
+        monitor.start()
+        try:
+            with logs:
+                status = self.run_campaign(job, logs, stop)
+        except KeyboardInterrupt:
+            # Checkpoints let the next worker carry on with the pending recipients
+            self.queue.release(campaign_id, self.worker_id)
+            raise
+        except Exception as e:
+            print(f"Campaign {campaign_id} failed: {str(e)}")
+            self.queue.fail(campaign_id, self.worker_id, str(e))
+            return True
+        finally:
+            done.set()
+            monitor.join()
+
+        if state.get('lease_lost'):
+            # Another worker owns the job now and sends its remaining recipients
+            return True
+        if status == 'stopped':
+            status = CONTROL_STATUSES.get(state.get('control') or self.queue.control(campaign_id), 'paused')
+        self.queue.finish(campaign_id, self.worker_id, status)
+        print(f"Campaign {campaign_id} {status}")
+        return True
+
+    def run_forever(self, poll_interval: Optional[float] = None):
+        """Keep claiming campaigns, sleeping while the queue is empty"""
+        poll_interval = poll_interval or Config.WORKER_POLL_INTERVAL
+        print(f"Campaign worker {self.worker_id} started")
+        while True:
+            if not self.run_once():
+                time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send queued email campaigns")
+    parser.add_argument('--once', action='store_true', help="Send at most one campaign, then exit")
+    parser.add_argument('--poll-interval', type=float, help="Seconds between queue checks while idle")
+    args = parser.parse_args()
+
+    Config.validate()
+    if not mongodb.connect():
+        raise SystemExit("Failed to connect to MongoDB")
+
+    worker = CampaignWorker()
+    try:
+        if args.once:
+            worker.run_once()
+        else:
+            worker.run_forever(args.poll_interval)
+    except KeyboardInterrupt:
+        print("Campaign worker stopped")
+
+
+if __name__ == '__main__':
+    main()
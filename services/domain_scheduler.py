@@ -0,0 +1,155 @@
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+from config import Config
+from .rate_limiter import TokenBucket
+
+
+def recipient_domain(email: str) -> str:
+    """Lowercased domain of an address, the part after the last @"""
+    return email.rpartition('@')[2].strip().lower()
+
+
+class _DomainState:
+    """Queued messages, sends in flight and rate limiter of one destination domain"""
+
+    __slots__ = ('queue', 'in_flight', 'max_in_flight', 'limiter')
+
+    def __init__(self, max_in_flight: float, limiter: Optional[TokenBucket]):
+        self.queue = deque()
+        self.in_flight = 0
+        self.max_in_flight = max_in_flight
+        self.limiter = limiter
+
+    @property
+    def idle(self) -> bool:
+        """Nothing queued or in flight, and the rate limiter has a send slot"""
+        return (
+            not self.queue and not self.in_flight
+            and (self.limiter is None or self.limiter.delay() == 0)
+        )
+
+
+class DomainScheduler:
+    """
+    Orders messages by destination domain instead of upload order
+
+    Reads up to `lookahead` recipients ahead into one queue per recipient
+    domain and hands them out round-robin across domains, so a list sorted
+    by domain does not send everything to one receiving server at a time.
+    A domain is skipped while it has its maximum sends in flight or its
+    rate limiter has no slot; the rate cap applies on top of the shard
+    limiters. Caps come from Config.DOMAIN_MAX_CONCURRENCY and
+    Config.DOMAIN_RATE_PER_MINUTE (0 = no limit), overridden per domain by
+    Config.DOMAIN_LIMITS. Used from a single thread, like BulkSendRun.
+    """
+
+    def __init__(
+        self,
+        items: Iterator[Tuple[int, Dict]],
+        lookahead: Optional[int] = None,
+        cap_concurrency: bool = True
+    ):
+        """
+        Args:
+            items: (index, recipient) pairs, e.g. enumerate(recipients)
+            lookahead: Recipients read ahead of the send; defaults to
+                Config.DOMAIN_LOOKAHEAD
+            cap_concurrency: Apply the per-domain concurrency caps; off
+                for serial sends that hold recipients back before sending
+                them, as batching does
+        """
+        self._items = items
+        self._exhausted = False
+        self.lookahead = max(1, Config.DOMAIN_LOOKAHEAD if lookahead is None else lookahead)
+        self.cap_concurrency = cap_concurrency
+        self._domains: Dict[str, _DomainState] = {}
+        # Domains with queued messages, in serving order
+        self._rotation = deque()
+        self._held = 0
+        self._released = 0
+
+    def __len__(self) -> int:
+        """Messages read ahead or queued for retry, not yet handed out"""
+        return self._held
+
+    def _state(self, domain: str) -> _DomainState:
+        state = self._domains.get(domain)
+        if state is None:
+            limits = Config.DOMAIN_LIMITS.get(domain, {})
+            max_concurrency = limits.get('max_concurrency', Config.DOMAIN_MAX_CONCURRENCY)
+            rate_per_minute = limits.get('rate_per_minute', Config.DOMAIN_RATE_PER_MINUTE)
+            max_in_flight = max_concurrency if max_concurrency and self.cap_concurrency else float('inf')
+            limiter = TokenBucket.per_minute(rate_per_minute) if rate_per_minute else None
+            state = self._domains[domain] = _DomainState(max_in_flight, limiter)
+        return state
+
+    def _queue(self, item: tuple, retry: bool):
+        domain = recipient_domain(item[1]['email'])
+        state = self._state(domain)
+        if not state.queue:
+            self._rotation.append(domain)
+        if retry:
+            state.queue.appendleft(item)
+        else:
+            state.queue.append(item)
+        self._held += 1
+
+    def _fill(self):
+        """Read recipients until `lookahead` are held or the input runs out"""
+        while not self._exhausted and self._held < self.lookahead:
+            pending = next(self._items, None)
+            if pending is None:
+                self._exhausted = True
+                return
+            self._queue((pending[0], pending[1], 0), retry=False)
+
+    def add_retry(self, item: tuple):
+        """Queue an (index, recipient, attempt) retry ahead of its domain's other messages"""
+        self._queue(item, retry=True)
+
+    def next(self) -> Tuple[Optional[tuple], float]:
+        """
+        Take the next message from the first domain in turn that can send
+
+        Returns:
+            Tuple of ((index, recipient, attempt) or None, seconds to wait).
+            When no domain can send, the wait is until the earliest rate
+            limited domain has a slot, or 0 if every queued domain is at its
+            concurrency cap (or nothing is queued).
+        """
+        self._fill()
+        wait = None
+        for _ in range(len(self._rotation)):
+            domain = self._rotation.popleft()
+            state = self._domains[domain]
+            if state.in_flight >= state.max_in_flight:
+                self._rotation.append(domain)
+                continue
+            if state.limiter is not None:
+                delay = state.limiter.delay()
+                if delay > 0:
+                    wait = delay if wait is None else min(wait, delay)
+                    self._rotation.append(domain)
+                    continue
+                state.limiter.try_acquire()
+
+            item = state.queue.popleft()
+            if state.queue:
+                self._rotation.append(domain)
+            state.in_flight += 1
+            self._held -= 1
+            return item, 0.0
+        return None, wait or 0.0
+
+    def release(self, recipient: Dict):
+        """Free the recipient's domain slot once its send has an outcome"""
+        state = self._domains.get(recipient_domain(recipient['email']))
+        if state is not None:
+            state.in_flight -= 1
+
+        # Drop idle domains now and then so long runs do not keep one entry per domain
+        self._released += 1
+        if self._released >= self.lookahead:
+            self._released = 0
+            for domain in [domain for domain, state in self._domains.items() if state.idle]:
+                del self._domains[domain]
@@ -1,101 +1,215 @@
 import smtplib
+from collections import OrderedDict
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-import time
-from typing import Dict, List, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional
 import streamlit as st
 from config import Config
+from .adaptive_rate import is_sender_fault, is_transient, smtp_error_code
+from .async_sender import AsyncBulkSender
+from .attachment_cache import load_attachment, load_attachments
+from .bulk_run import BulkSendRun
+from .mime_builder import UNDISCLOSED_RECIPIENTS, MessageSkeleton, encode_address_list
+from .render_cache import RenderCache, RenderedMessage
+from .sender_shards import SenderShard, ShardRouter, load_sender_shards
+from .template_service import compile_template
 
 class EmailService:
     """Gmail SMTP email service"""
     
-    def __init__(self):
-        self.smtp_server = Config.SMTP_SERVER
-        self.smtp_port = Config.SMTP_PORT
-        self.email = Config.GMAIL_EMAIL
-        self.password = Config.GMAIL_APP_PASSWORD
-        self.rate_limit = Config.RATE_LIMIT_EMAILS_PER_MINUTE
+    def __init__(self, shards: Optional[List[SenderShard]] = None):
+        """
+        Args:
+            shards: Sender identities and relays to spread campaigns over;
+                defaults to Config.SENDER_ACCOUNTS or the Gmail account
+        """
+        self.router = ShardRouter(shards or load_sender_shards())
+        primary = self.router.primary
+        self.smtp_server = primary.smtp_server
+        self.smtp_port = primary.smtp_port
+        self.email = primary.email
+        self.password = primary.password
+        self.rate_limit = primary.rate_per_minute
+        self.skeleton = MessageSkeleton()
     
-    def _create_smtp_connection(self):
-        """Create and return SMTP connection"""
+    def build_message(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        attachments: Optional[List[str]] = None,
+        from_email: Optional[str] = None
+    ) -> MIMEMultipart:
+        """
+        Build the MIME message for a single email
+        
+        Used for non-ASCII addresses; other messages are spliced from a
+        MessageSkeleton instead.
+        """
+        # Create message
+        msg = MIMEMultipart('mixed' if attachments else 'alternative')
+        msg['From'] = from_email or self.email
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        # Attach HTML content
+        html_part = MIMEText(html_content, 'html')
+        msg.attach(html_part)
+        
+        # Attach files if any (encoded once and cached across messages)
+        if attachments:
+            for filepath in attachments:
+                try:
+                    msg.attach(load_attachment(filepath).mime_part())
+                except Exception as e:
+                    print(f"Failed to attach file {filepath}: {str(e)}")
+        
+        return msg
+    
+    def campaign_skeleton(self, attachments: Optional[List[str]] = None) -> MessageSkeleton:
+        """
+        Message skeleton for a campaign, with its attachments encoded once
+        
+        Raises:
+            OSError: If an attachment cannot be read
+        """
+        if not attachments:
+            return self.skeleton
+        return MessageSkeleton(load_attachments(attachments))
+    
+    def _send(
+        self,
+        shard: SenderShard,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        attachments: Optional[List[str]] = None,
+        use_pool: bool = False,
+        skeleton: Optional[MessageSkeleton] = None,
+        encoded: Optional[tuple] = None
+    ) -> tuple[bool, Optional[str], bool, bool]:
+        """
+        Send a single email through a shard and classify the outcome
+        
+        Args:
+            skeleton: Campaign skeleton already carrying the attachments;
+                built from `attachments` when not given
+            encoded: Subject and body already encoded for the skeleton
+                (RenderedMessage.encoded)
+        
+        Returns:
+            tuple: (success, error_message, transient, sender_fault) where
+            transient marks throttling replies and dropped connections worth
+            retrying, and sender_fault marks failures caused by the account
+            or relay rather than the recipient
+        """
         try:
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.email, self.password)
-            return server
+            if not to_email.isascii():
+                msg = self.build_message(to_email, subject, html_content, attachments, shard.email)
+                shard.send_message(msg, use_pool)
+            else:
+                skeleton = skeleton or self.campaign_skeleton(attachments)
+                if encoded is None:
+                    encoded = (skeleton.encode_subject(subject), skeleton.encode_body(html_content))
+                raw = skeleton.assemble(shard.email, to_email, *encoded)
+                shard.send_message(raw, use_pool, [to_email])
+            return True, None, False, False
+            
         except Exception as e:
-            raise Exception(f"Failed to connect to SMTP server: {str(e)}")
+            code = smtp_error_code(e)
+            disconnected = isinstance(e, smtplib.SMTPServerDisconnected)
+            return False, str(e), is_transient(code, disconnected), is_sender_fault(code)
     
     def send_email(
         self,
         to_email: str,
         subject: str,
         html_content: str,
-        attachments: Optional[List[str]] = None
+        attachments: Optional[List[str]] = None,
+        use_pool: bool = False
     ) -> tuple[bool, Optional[str]]:
         """
         Send a single email
         
+        Args:
+            use_pool: Reuse an authenticated session from the connection
+                pool instead of opening a new one for this message
+        
         Returns:
             tuple: (success: bool, error_message: str or None)
         """
-        try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = self.email
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            # Attach HTML content
-            html_part = MIMEText(html_content, 'html')
-            msg.attach(html_part)
-            
-            # Attach files if any
-            if attachments:
-                for filepath in attachments:
-                    try:
-                        with open(filepath, 'rb') as f:
-                            part = MIMEBase('application', 'octet-stream')
-                            part.set_payload(f.read())
-                            encoders.encode_base64(part)
-                            part.add_header(
-                                'Content-Disposition',
-                                f'attachment; filename= {filepath.split("/")[-1]}'
-                            )
-                            msg.attach(part)
-                    except Exception as e:
-                        print(f"Failed to attach file {filepath}: {str(e)}")
-            
-            # Send email
-            server = self._create_smtp_connection()
-            server.send_message(msg)
-            server.quit()
-            
-            return True, None
-            
-        except Exception as e:
-            return False, str(e)
+        success, error, _, _ = self._send(
+            self.router.primary, to_email, subject, html_content, attachments, use_pool
+        )
+        return success, error
     
     def send_bulk_emails(
         self,
-        recipients: List[Dict],
+        recipients: Iterable[Dict],
         subject: str,
         html_template: str,
-        progress_callback=None
+        progress_callback=None,
+        use_pool: bool = True,
+        concurrency: Optional[int] = None,
+        attachments: Optional[List[str]] = None,
+        on_result=None,
+        should_stop=None,
+        total: Optional[int] = None,
+        batch_size: Optional[int] = None
     ) -> Dict:
         """
         Send bulk emails with rate limiting
         
+        Messages are spread over the sender shards by weighted round-robin;
+        a shard that keeps failing is benched and its traffic moves to the
+        others. Each shard's rate adapts to the server: it creeps up while
+        sends succeed and is cut back, with a cooldown, on throttling
+        replies. Throttled messages are put back on the queue up to
+        Config.SEND_MAX_RETRIES times. Progress messages include the
+        combined rate currently in effect.
+        
         Args:
-            recipients: List of dicts with 'email' and other merge fields
+            recipients: Dicts with 'email' and other merge fields; any
+                iterable, consumed one recipient at a time
             subject: Email subject (can include {variables})
             html_template: HTML template with {variables}
             progress_callback: Optional callback function for progress updates
+            use_pool: Keep SMTP sessions open across messages (default)
+            concurrency: Number of parallel SMTP sessions; defaults to
+                Config.SEND_CONCURRENCY. Values above 1 always use the pool.
+            attachments: File paths attached to every message; each file
+                is read and encoded once for the whole campaign
+            on_result: Optional callback(index, recipient, success, error)
+                called as soon as each recipient's final outcome is known,
+                e.g. to checkpoint progress
+            should_stop: Optional callable checked before each message;
+                returning True stops the send after in-flight messages
+            total: Number of recipients, for progress reporting when
+                `recipients` has no length (e.g. a generator); progress
+                callbacks get None as the total when it is not known
+            batch_size: Recipients of an identical message sent in one SMTP
+                transaction; defaults to Config.SEND_BATCH_SIZE. Values above
+                1 send over a single session and ignore concurrency.
+        
+        Recipients with the same values for the fields the templates use
+        share one rendered and encoded message (see RenderCache). With
+        batching, such recipients are grouped and each group is delivered
+        as one message with a RCPT TO per recipient; recipients the server
+        refuses are failed (or retried) individually.
+        
+        Recipients are handed out round-robin across their domains, with
+        per-domain concurrency and rate caps (see DomainScheduler), so a
+        list sorted by domain does not flood one receiving server.
         
         Returns:
-            Dict with sent_count, failed_count, and errors list
+            Dict with sent_count, failed_count, errors list, handled_by
+            (recipient email -> shard name), the final rate_per_minute,
+            whether the send was stopped early and render_cache hit
+            statistics
+        
+        Raises:
+            OSError: If an attachment cannot be read
         """
         results = {
             'sent_count': 0,
@@ -103,58 +217,287 @@ class EmailService:
             'errors': []
         }
         
-        total = len(recipients)
-        emails_this_minute = 0
-        minute_start = time.time()
+        concurrency = concurrency or Config.SEND_CONCURRENCY
+        batch_size = batch_size or Config.SEND_BATCH_SIZE
+        run = BulkSendRun(
+            recipients, results, progress_callback, self.router,
+            on_result=on_result, should_stop=should_stop, total=total,
+            domain_concurrency=batch_size <= 1
+        )
+        renderer = RenderCache(compile_template(subject), compile_template(html_template))
+        skeleton = self.campaign_skeleton(attachments)
         
-        for i, recipient in enumerate(recipients):
-            # Rate limiting
-            if emails_this_minute >= self.rate_limit:
-                elapsed = time.time() - minute_start
-                if elapsed < 60:
-                    wait_time = 60 - elapsed
-                    if progress_callback:
-                        progress_callback(
-                            i, total, 
-                            f"Rate limit reached. Waiting {int(wait_time)}s..."
-                        )
-                    time.sleep(wait_time)
-                emails_this_minute = 0
-                minute_start = time.time()
+        for shard in self.router.shards:
+            shard.ensure_pool_size(concurrency)
+        
+        try:
+            if batch_size > 1:
+                self._send_bulk_batched(run, renderer, attachments, skeleton, use_pool, batch_size)
+            elif concurrency > 1:
+                self._send_bulk_concurrent(run, renderer, attachments, skeleton, concurrency)
+            else:
+                self._send_bulk_serial(run, renderer, attachments, skeleton, use_pool)
+        finally:
+            self.router.close()
+        
+        run.finish()
+        results['render_cache'] = renderer.stats()
+        return results
+    
+    def _send_bulk_serial(
+        self,
+        run: BulkSendRun,
+        renderer: RenderCache,
+        attachments: Optional[List[str]],
+        skeleton: MessageSkeleton,
+        use_pool: bool
+    ):
+        """Send to each recipient in turn over a single session"""
+        while True:
+            item = run.next_item()
+            if item is None:
+                break
+            shard = run.router.choose()
+            if shard is None:
+                run.record_no_sender(*item)
+                continue
             
-            # Personalize content
-            personalized_subject = subject.format(**recipient)
-            personalized_html = html_template.format(**recipient)
+            # Rate limiting
+            run.acquire(shard)
             
-            # Send email
-            success, error = self.send_email(
+            # Personalize content and send
+            recipient = item[1]
+            message = renderer.render(recipient)
+            outcome = self._send(
+                shard,
                 to_email=recipient['email'],
-                subject=personalized_subject,
-                html_content=personalized_html
+                subject=message.subject,
+                html_content=message.html,
+                attachments=attachments,
+                use_pool=use_pool,
+                skeleton=skeleton,
+                encoded=message.encoded
             )
             
-            if success:
-                results['sent_count'] += 1
+            run.record(*item, shard, *outcome)
+    
+    def _send_bulk_concurrent(
+        self,
+        run: BulkSendRun,
+        renderer: RenderCache,
+        attachments: Optional[List[str]],
+        skeleton: MessageSkeleton,
+        concurrency: int
+    ):
+        """
+        Send over several pooled sessions at once
+        
+        The calling thread personalizes messages, takes rate limit slots and
+        reports progress, so progress_callback is never called from a worker
+        thread.
+        """
+        in_flight = set()
+        # Future -> (item, shard) it is sending
+        pending = {}
+        
+        def collect(done):
+            for future in done:
+                item, shard = pending.pop(future)
+                run.record(*item, shard, *future.result())
+        
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                while len(in_flight) >= concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                
+                item = run.next_item()
+                if item is None:
+                    if not in_flight:
+                        break
+                    # Wait for in-flight sends, which may put retries back on the queue
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                    continue
+                shard = run.router.choose()
+                if shard is None:
+                    run.record_no_sender(*item)
+                    continue
+                
+                run.acquire(shard)
+                
+                recipient = item[1]
+                message = renderer.render(recipient)
+                future = executor.submit(
+                    self._send,
+                    shard,
+                    to_email=recipient['email'],
+                    subject=message.subject,
+                    html_content=message.html,
+                    attachments=attachments,
+                    use_pool=True,
+                    skeleton=skeleton,
+                    encoded=message.encoded
+                )
+                pending[future] = (item, shard)
+                in_flight.add(future)
+    
+    def _send_group(
+        self,
+        shard: SenderShard,
+        to_emails: List[str],
+        message: RenderedMessage,
+        skeleton: MessageSkeleton,
+        use_pool: bool
+    ) -> List[tuple]:
+        """
+        Send one message to several recipients in a single SMTP transaction
+        
+        Recipients are listed in the To header when Config.SEND_BATCH_HEADER
+        is 'to', otherwise they only appear in the envelope, like Bcc.
+        
+        Returns:
+            One (success, error_message, transient, sender_fault) tuple per
+            recipient, as from _send; recipients refused at RCPT TO get their
+            own reply, failures of the whole transaction are shared by all
+        """
+        if Config.SEND_BATCH_HEADER.lower() == 'to':
+            to_header = encode_address_list(to_emails)
+        else:
+            to_header = UNDISCLOSED_RECIPIENTS
+        try:
+            raw = skeleton.assemble_to(shard.email, to_header, *message.encoded)
+            refused = shard.send_message(raw, use_pool, to_emails)
+        except smtplib.SMTPRecipientsRefused as e:
+            refused = e.recipients
+        except Exception as e:
+            code = smtp_error_code(e)
+            disconnected = isinstance(e, smtplib.SMTPServerDisconnected)
+            outcome = (False, str(e), is_transient(code, disconnected), is_sender_fault(code))
+            return [outcome] * len(to_emails)
+        
+        outcomes = []
+        for to_email in to_emails:
+            reply = refused.get(to_email)
+            if reply is None:
+                outcomes.append((True, None, False, False))
             else:
-                results['failed_count'] += 1
-                results['errors'].append({
-                    'email': recipient['email'],
-                    'error': error
-                })
+                code = reply[0]
+                outcomes.append((False, str({to_email: reply}), is_transient(code), is_sender_fault(code)))
+        return outcomes
+    
+    def _send_bulk_batched(
+        self,
+        run: BulkSendRun,
+        renderer: RenderCache,
+        attachments: Optional[List[str]],
+        skeleton: MessageSkeleton,
+        use_pool: bool,
+        batch_size: int
+    ):
+        """
+        Send identical messages in groups of up to batch_size recipients
+        
+        Recipients are grouped by the RenderedMessage they share. A group is
+        sent once full; at most batch_size * 10 recipients wait in partial
+        groups, beyond that the oldest group is sent as it is. Once
+        should_stop fires, partial groups are dropped unsent. Addresses
+        that are not ASCII are sent on their own.
+        """
+        groups: 'OrderedDict[RenderedMessage, List[tuple]]' = OrderedDict()
+        buffered = 0
+        
+        def deliver(message, items):
+            shard = run.router.choose(len(items))
+            if shard is None:
+                for item in items:
+                    run.record_no_sender(*item)
+                return
             
-            emails_this_minute += 1
+            # The rate limit counts recipients, not transactions
+            for _ in items:
+                run.acquire(shard)
             
-            # Progress update
-            if progress_callback:
-                progress_callback(i + 1, total, f"Sent to {recipient['email']}")
+            to_emails = [item[1]['email'] for item in items]
+            outcomes = self._send_group(shard, to_emails, message, skeleton, use_pool)
+            for item, outcome in zip(items, outcomes):
+                run.record(*item, shard, *outcome)
         
-        return results
+        while True:
+            item = run.next_item()
+            if item is None:
+                if not groups or run.stopped:
+                    # After a stop, buffered recipients get no outcome and stay pending for a resume
+                    break
+                # Send what is left, which may put retries back on the queue
+                while groups:
+                    message, items = groups.popitem(last=False)
+                    buffered -= len(items)
+                    deliver(message, items)
+                continue
+            
+            recipient = item[1]
+            message = renderer.render(recipient)
+            if not recipient['email'].isascii():
+                shard = run.router.choose()
+                if shard is None:
+                    run.record_no_sender(*item)
+                    continue
+                run.acquire(shard)
+                outcome = self._send(
+                    shard,
+                    to_email=recipient['email'],
+                    subject=message.subject,
+                    html_content=message.html,
+                    attachments=attachments,
+                    use_pool=use_pool,
+                    skeleton=skeleton,
+                    encoded=message.encoded
+                )
+                run.record(*item, shard, *outcome)
+                continue
+            
+            items = groups.setdefault(message, [])
+            items.append(item)
+            buffered += 1
+            if len(items) >= batch_size:
+                del groups[message]
+                buffered -= len(items)
+                deliver(message, items)
+            elif buffered >= batch_size * 10:
+                message, items = groups.popitem(last=False)
+                buffered -= len(items)
+                deliver(message, items)
+    
+    async def send_bulk_emails_async(
+        self,
+        recipients: Iterable[Dict],
+        subject: str,
+        html_template: str,
+        progress_callback=None,
+        attachments: Optional[List[str]] = None,
+        on_result=None,
+        should_stop=None,
+        total: Optional[int] = None
+    ) -> Dict:
+        """
+        Send bulk emails through the asyncio pipeline
+        
+        Same arguments and results as send_bulk_emails, but rendering, MIME
+        building and delivery run as queued stages over many concurrent SMTP
+        sessions on one thread. Can be run headless with asyncio.run().
+        """
+        sender = AsyncBulkSender(self)
+        return await sender.send(
+            recipients, subject, html_template, progress_callback, attachments, on_result, should_stop, total
+        )
     
     def send_test_email(
         self,
         to_email: str,
         subject: str,
-        html_content: str
+        html_content: str,
+        attachments: Optional[List[str]] = None
     ) -> tuple[bool, Optional[str]]:
         """Send a test email"""
-        return self.send_email(to_email, subject, html_content)
+        return self.send_email(to_email, subject, html_content, attachments)
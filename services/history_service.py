@@ -0,0 +1,109 @@
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from database import mongodb
+
+# Fields shown on the Campaign History page
+HISTORY_FIELDS = {
+    'name': 1, 'subject': 1, 'status': 1, 'control': 1, 'created_at': 1,
+    'recipients_count': 1, 'sent_count': 1, 'failed_count': 1, 'progress': 1, 'error': 1
+}
+
+# Fields shown in a campaign's email log table
+LOG_FIELDS = {'recipient_email': 1, 'status': 1, 'sent_at': 1, 'error_message': 1}
+
+# Newest first; _id breaks ties between campaigns created in the same instant
+HISTORY_SORT = [('created_at', -1), ('_id', -1)]
+
+
+class HistoryService:
+    """
+    Campaign history served page by page from MongoDB
+
+    Pages use keyset pagination on (created_at, _id): each page continues
+    after the last campaign of the previous one instead of skipping rows,
+    so any page costs the same however many campaigns there are. Status
+    filtering runs in the query and search uses the name/subject text index.
+    A campaign's email logs are paged the same way on _id.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or mongodb
+
+    @staticmethod
+    def build_query(status: Optional[str] = None, search: Optional[str] = None, after: Optional[Tuple] = None) -> Dict:
+        """MongoDB filter for a history page"""
+        clauses = []
+        if status:
+            clauses.append({'status': status})
+        if search:
+            clauses.append({'$text': {'$search': search}})
+        if after:
+            created_at, campaign_id = after
+            clauses.append({'$or': [
+                {'created_at': {'$lt': created_at}},
+                {'created_at': created_at, '_id': {'$lt': campaign_id}}
+            ]})
+        if not clauses:
+            return {}
+        return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+    def get_page(
+        self,
+        status: Optional[str] = None,
+        search: Optional[str] = None,
+        after: Optional[Tuple] = None,
+        page_size: Optional[int] = None
+    ) -> Tuple[List[Dict], Optional[Tuple]]:
+        """
+        One page of campaigns, newest first
+
+        Args:
+            status: Only campaigns with this status
+            search: Words to find in the campaign name or subject
+            after: Cursor returned with the previous page
+            page_size: Campaigns per page; defaults to Config.HISTORY_PAGE_SIZE
+
+        Returns:
+            tuple: (campaigns, cursor for the next page or None on the last page)
+        """
+        page_size = page_size or Config.HISTORY_PAGE_SIZE
+        # Fetch one extra campaign to know whether another page follows
+        campaigns = list(
+            self.db.campaigns.find(self.build_query(status, search, after), HISTORY_FIELDS)
+            .sort(HISTORY_SORT)
+            .limit(page_size + 1)
+        )
+        if len(campaigns) <= page_size:
+            return campaigns, None
+        campaigns = campaigns[:page_size]
+        last = campaigns[-1]
+        return campaigns, (last['created_at'], last['_id'])
+
+    def get_log_page(
+        self,
+        campaign_id: str,
+        status: Optional[str] = None,
+        after=None,
+        page_size: Optional[int] = None
+    ) -> Tuple[List[Dict], Optional[object]]:
+        """
+        One page of a campaign's email logs, in the order they were written
+
+        Returns:
+            tuple: (logs, cursor for the next page or None on the last page)
+        """
+        page_size = page_size or Config.LOG_PAGE_SIZE
+        query = {'campaign_id': campaign_id}
+        if status:
+            query['status'] = status
+        if after is not None:
+            query['_id'] = {'$gt': after}
+        logs = list(
+            self.db.email_logs.find(query, LOG_FIELDS)
+            .sort('_id', 1)
+            .limit(page_size + 1)
+        )
+        if len(logs) <= page_size:
+            return logs, None
+        logs = logs[:page_size]
+        return logs, logs[-1]['_id']
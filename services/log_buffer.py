@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+from config import Config
+from database import mongodb
+from models import EmailLog
+from .stats_service import StatsService
+
+# MongoDB duplicate key error code
+_DUPLICATE_KEY = 11000
+
+
+class EmailLogBuffer:
+    """
+    Write-behind buffer for a campaign's email logs
+
+    Logs are collected as send outcomes arrive and written with unordered
+    insert_many in batches of `batch_size`, or after `flush_interval`
+    seconds. Each batch that lands increments the campaign's sent_count and
+    failed_count and the global and daily statistics. Logs whose
+    idempotency key is already stored are skipped and not counted again.
+    A failed write during the send is printed and its logs are kept for
+    the next flush, retried once the interval has passed, so a transient
+    database error never aborts the send; only the final flush raises.
+    Use as a context manager so the last batch is flushed when the send
+    finishes or fails.
+    """
+
+    def __init__(
+        self,
+        campaign_id: str,
+        db=None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None
+    ):
+        self.campaign_id = campaign_id
+        self.db = db or mongodb
+        self.stats = StatsService(self.db)
+        self.batch_size = batch_size or Config.LOG_BATCH_SIZE
+        self.flush_interval = Config.LOG_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._pending: List[Dict] = []
+        self._last_flush = time.monotonic()
+        self._failing = False
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'EmailLogBuffer':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.flush()
+        except Exception as e:
+            if exc_type is None:
+                raise
+            # Don't hide the error that ended the send
+            print(f"Failed to flush email logs for campaign {self.campaign_id}: {str(e)}")
+
+    def add(self, email_log: EmailLog):
+        """Buffer a log, flushing when the batch is full or the interval has passed"""
+        with self._lock:
+            self._pending.append(email_log.to_dict())
+            if self._due() or (len(self._pending) >= self.batch_size and not self._failing):
+                try:
+                    self._flush()
+                except Exception as e:
+                    print(f"Failed to flush email logs for campaign {self.campaign_id}: {str(e)}")
+
+    def flush_if_due(self):
+        """Flush if the interval has passed; safe to call from another thread"""
+        with self._lock:
+            if self._pending and self._due():
+                self._flush()
+
+    def flush(self):
+        """Write every buffered log"""
+        with self._lock:
+            self._flush()
+
+    def _due(self) -> bool:
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        self._failing = True
+        batch, self._pending = self._pending, []
+
+        landed = list(batch)
+        try:
+            self.db.email_logs.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            failed = [error for error in errors if error.get('code') != _DUPLICATE_KEY]
+            if failed:
+                # Keep the logs that did not land for the next flush
+                self._pending = [batch[error['index']] for error in failed] + self._pending
+            skipped = {error['index'] for error in errors}
+            landed = [log for i, log in enumerate(batch) if i not in skipped]
+            if failed:
+                self._count(landed)
+                raise
+        except Exception:
+            self._pending = batch + self._pending
+            raise
+        self._failing = False
+        self._count(landed)
+
+    def _count(self, logs: List[Dict]):
+        """Add landed logs to the campaign counters and statistics"""
+        counts = Counter(log['status'] for log in logs)
+        increments = {
+            'sent_count': counts.get('sent', 0),
+            'failed_count': counts.get('failed', 0)
+        }
+        if any(increments.values()):
+            self.db.campaigns.update_one(
+                {'_id': ObjectId(self.campaign_id)},
+                {'$inc': increments}
+            )
+            self.stats.record_logs(logs)
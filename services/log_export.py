@@ -0,0 +1,137 @@
+"""
+Streaming export of a campaign's email logs
+
+Logs are read with a projected, batched cursor and written incrementally,
+so memory use does not grow with the campaign size. Export from the
+command line with:
+
+    python -m services.log_export <campaign_id> [--format csv|csv.gz|parquet] [--status sent|failed] [-o PATH]
+"""
+import argparse
+import csv
+import gzip
+import os
+import tempfile
+from typing import Iterator, List, Optional
+from config import Config
+from database import mongodb
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+# Export formats and their file extensions
+FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet'}
+
+# MIME type of each export format, for downloads
+MIME_TYPES = {'csv': 'text/csv', 'csv.gz': 'application/gzip', 'parquet': 'application/vnd.apache.parquet'}
+
+COLUMNS = ['Email', 'Status', 'Sent At', 'Error']
+
+_PROJECTION = {'_id': 0, 'recipient_email': 1, 'status': 1, 'sent_at': 1, 'error_message': 1}
+
+
+def iter_log_rows(campaign_id: str, status: Optional[str] = None, db=None) -> Iterator[List]:
+    """Yield [email, status, sent at, error] rows for a campaign's logs"""
+    db = db or mongodb
+    query = {'campaign_id': campaign_id}
+    if status:
+        query['status'] = status
+    cursor = db.email_logs.find(query, _PROJECTION, batch_size=Config.LOG_EXPORT_BATCH_SIZE)
+    for log in cursor:
+        sent_at = log.get('sent_at')
+        yield [
+            log['recipient_email'],
+            log['status'],
+            sent_at.strftime('%Y-%m-%d %H:%M:%S') if sent_at else '',
+            log.get('error_message') or ''
+        ]
+
+
+def _write_csv(rows: Iterator[List], path: str, compress: bool):
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+
+def _parquet_table(batch: List[List], schema):
+    """Arrow table from a batch of rows"""
+    columns = list(zip(*batch)) or [()] * len(COLUMNS)
+    return pa.table([list(column) for column in columns], schema=schema)
+
+
+def _write_parquet(rows: Iterator[List], path: str):
+    if pa is None:
+        raise ValueError("Parquet export requires pyarrow (pip install pyarrow)")
+    schema = pa.schema([(column, pa.string()) for column in COLUMNS])
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        written = False
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= Config.LOG_EXPORT_BATCH_SIZE:
+                writer.write_table(_parquet_table(batch, schema))
+                batch = []
+                written = True
+        # An empty export still gets one (empty) table so the file has its columns
+        if batch or not written:
+            writer.write_table(_parquet_table(batch, schema))
+
+
+def export_logs(
+    campaign_id: str,
+    fmt: str = 'csv',
+    status: Optional[str] = None,
+    path: Optional[str] = None,
+    db=None
+) -> str:
+    """
+    Export a campaign's email logs to a file
+
+    Args:
+        fmt: 'csv', 'csv.gz' or 'parquet'
+        status: Only logs with this status
+        path: Output file; a temporary file is created when not given
+
+    Returns:
+        Path of the written file
+
+    Raises:
+        ValueError: For an unknown format, or Parquet without pyarrow
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix=f"campaign_logs_{campaign_id}_", suffix=FORMATS[fmt])
+        os.close(fd)
+
+    rows = iter_log_rows(campaign_id, status, db)
+    if fmt == 'parquet':
+        _write_parquet(rows, path)
+    else:
+        _write_csv(rows, path, compress=(fmt == 'csv.gz'))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a campaign's email logs")
+    parser.add_argument('campaign_id')
+    parser.add_argument('--format', dest='fmt', choices=list(FORMATS), default='csv')
+    parser.add_argument('--status', choices=['sent', 'failed'])
+    parser.add_argument('-o', '--output', help="Output file (default: campaign_logs_<id><ext>)")
+    args = parser.parse_args()
+
+    if not mongodb.connect():
+        raise SystemExit("Failed to connect to MongoDB")
+    output = args.output or f"campaign_logs_{args.campaign_id}{FORMATS[args.fmt]}"
+    export_logs(args.campaign_id, args.fmt, args.status, output)
+    print(f"Exported logs to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import base64
+import secrets
+from email.header import Header
+from email.utils import formataddr
+from typing import Dict, List, Optional
+from .attachment_cache import CachedAttachment
+
+CRLF = b'\r\n'
+
+
+def encode_header_value(value: str, header_name: str) -> bytes:
+    """RFC 2047-encode and fold a header value; CR/LF in the value are flattened"""
+    value = ' '.join(value.splitlines())
+    charset = 'us-ascii' if value.isascii() else 'utf-8'
+    header = Header(value, charset, header_name=header_name)
+    return header.encode(linesep='\r\n').encode('ascii')
+
+
+def encode_address(address: str) -> bytes:
+    """Encode a bare address for a To/From header"""
+    address = ' '.join(address.splitlines()).strip()
+    return formataddr(('', address)).encode('ascii')
+
+
+def encode_address_list(addresses: List[str]) -> bytes:
+    """Encode bare addresses for a To header, one per folded line"""
+    return b',\r\n '.join(encode_address(address) for address in addresses)
+
+
+# To header of messages whose recipients are all blind copies
+UNDISCLOSED_RECIPIENTS = b'undisclosed-recipients:;'
+
+
+class MessageSkeleton:
+    """
+    Prebuilt multipart message for a campaign
+
+    The MIME boundary, constant headers and any attachments are encoded
+    once. Each message is then assembled by splicing the From, To and
+    Subject headers and the base64-encoded HTML body into the prebuilt
+    bytes, skipping the email package's tree building and serialization.
+    Addresses must be ASCII; EmailService falls back to build_message
+    otherwise.
+    """
+
+    def __init__(self, attachments: Optional[List[CachedAttachment]] = None):
+        """
+        Args:
+            attachments: Encoded attachments shared by every message; the
+                message becomes multipart/mixed when there are any
+        """
+        # '_' and '.' never occur in base64 output, so the boundary cannot clash with the body
+        self.boundary = f"==bulk_{secrets.token_hex(12)}.="
+        boundary = self.boundary.encode('ascii')
+        subtype = b'mixed' if attachments else b'alternative'
+
+        self._content_type = (
+            b'Content-Type: multipart/' + subtype + b'; boundary="' + boundary + b'"' + CRLF
+            + b'MIME-Version: 1.0' + CRLF
+        )
+        self._part_head = (
+            CRLF + b'--' + boundary + CRLF
+            + b'Content-Type: text/html; charset="utf-8"' + CRLF
+            + b'MIME-Version: 1.0' + CRLF
+            + b'Content-Transfer-Encoding: base64' + CRLF
+            + CRLF
+        )
+        # Attachment parts are joined once and shared by every message
+        self._tail = b''.join(
+            [b'--' + boundary + CRLF + a.headers + CRLF + a.body for a in attachments or ()]
+            + [b'--' + boundary + b'--' + CRLF]
+        )
+        self._from_lines: Dict[str, bytes] = {}
+
+    def _from_line(self, from_email: str) -> bytes:
+        line = self._from_lines.get(from_email)
+        if line is None:
+            line = b'From: ' + encode_address(from_email) + CRLF
+            self._from_lines[from_email] = line
+        return line
+
+    @staticmethod
+    def encode_body(html_content: str) -> bytes:
+        """Base64-encode an HTML body into 76-character CRLF lines"""
+        return base64.encodebytes(html_content.encode('utf-8')).replace(b'\n', CRLF) or CRLF
+
+    @staticmethod
+    def encode_subject(subject: str) -> bytes:
+        """Encode a Subject header value"""
+        return encode_header_value(subject, 'Subject')
+
+    def assemble(self, from_email: str, to_email: str, subject: bytes, body: bytes) -> bytes:
+        """Splice pre-encoded subject and body bytes into a complete message"""
+        return self.assemble_to(from_email, encode_address(to_email), subject, body)
+
+    def assemble_to(self, from_email: str, to_header: bytes, subject: bytes, body: bytes) -> bytes:
+        """Like assemble, with the To header value already encoded (e.g. for several recipients)"""
+        return b''.join((
+            self._content_type,
+            self._from_line(from_email),
+            b'To: ', to_header, CRLF,
+            b'Subject: ', subject, CRLF,
+            self._part_head,
+            body,
+            self._tail
+        ))
+
+    def build(self, from_email: str, to_email: str, subject: str, html_content: str) -> bytes:
+        """Build the raw bytes of one message"""
+        return self.assemble(
+            from_email,
+            to_email,
+            self.encode_subject(subject),
+            self.encode_body(html_content)
+        )
@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Optional
+from pymongo import ReturnDocument
+from config import Config
+from database import mongodb
+
+
+class TokenBucket:
+    """
+    Thread- and asyncio-safe token bucket rate limiter
+
+    Tokens refill continuously at `rate` per second up to `burst`. Each
+    acquire takes one token; when the bucket is empty the caller reserves
+    the next token and sleeps exactly until it becomes available, so sends
+    are spread evenly instead of arriving in per-minute bursts.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Tokens added per second
+            burst: Maximum number of tokens the bucket holds
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, emails_per_minute: float, burst: int = 1) -> 'TokenBucket':
+        """Create a bucket from an emails-per-minute rate"""
+        return cls(emails_per_minute / 60, burst)
+
+    def _refill(self):
+        """Add the tokens earned since the last update (caller holds the lock)"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _reserve(self) -> float:
+        """Take the next token and return how long to wait until it is available"""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    async def _reserve_async(self) -> float:
+        """Async hook for _reserve; local buckets never block"""
+        return self._reserve()
+
+    def set_rate(self, rate: float):
+        """Change the refill rate, keeping the tokens earned at the old rate"""
+        with self._lock:
+            self._refill()
+            self.rate = max(rate, 1e-9)
+
+    def pause(self, seconds: float):
+        """Empty the bucket so no token is available for the next `seconds`"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+    def delay(self) -> float:
+        """Seconds until the next token is available, without taking it"""
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available right now"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, on_wait: Optional[Callable[[float], None]] = None) -> float:
+        """
+        Take one token, sleeping until it is available
+
+        Args:
+            on_wait: Called with the wait time in seconds before sleeping
+
+        Returns:
+            Seconds waited
+        """
+        wait_time = self._reserve()
+        if wait_time > 0:
+            if on_wait:
+                on_wait(wait_time)
+            time.sleep(wait_time)
+        return wait_time
+
+    async def acquire_async(self, on_wait: Optional[Callable[[float], None]] = None) -> float:
+        """Async version of acquire that yields to the event loop while waiting"""
+        wait_time = await self._reserve_async()
+        if wait_time > 0:
+            if on_wait:
+                on_wait(wait_time)
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+
+class MongoTokenBucket(TokenBucket):
+    """
+    Token bucket stored in a MongoDB document
+
+    Every reservation is a single atomic pipeline update evaluated against
+    the server clock, so several sender processes sharing the same key
+    respect one account-wide quota.
+    """
+
+    def __init__(self, collection, key: str, rate: float, burst: int = 1):
+        super().__init__(rate, burst)
+        self.collection = collection
+        self.key = key
+
+    def _refilled_tokens(self) -> Dict:
+        """Aggregation expression for the bucket level at $$NOW"""
+        elapsed_ms = {'$subtract': ['$$NOW', {'$ifNull': ['$updated_at', '$$NOW']}]}
+        return {
+            '$min': [
+                self.burst,
+                {'$add': [
+                    {'$ifNull': ['$tokens', self.burst]},
+                    {'$multiply': [{'$divide': [elapsed_ms, 1000]}, self.rate]}
+                ]}
+            ]
+        }
+
+    def _update(self, *stages: Dict) -> Dict:
+        """Refill the bucket, apply the given pipeline stages atomically and return the result"""
+        return self.collection.find_one_and_update(
+            {'_id': self.key},
+            [
+                {'$set': {'tokens': self._refilled_tokens(), 'updated_at': '$$NOW'}},
+                *stages
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _reserve(self) -> float:
+        doc = self._update({'$set': {'tokens': {'$subtract': ['$tokens', 1]}}})
+        return max(0.0, -doc['tokens'] / self.rate)
+
+    async def _reserve_async(self) -> float:
+        return await asyncio.to_thread(self._reserve)
+
+    def set_rate(self, rate: float):
+        self.rate = max(rate, 1e-9)
+
+    def pause(self, seconds: float):
+        self._update({'$set': {'tokens': {'$subtract': [{'$min': ['$tokens', 0]}, seconds * self.rate]}}})
+
+    def delay(self) -> float:
+        doc = self._update()
+        return max(0.0, (1 - doc['tokens']) / self.rate)
+
+    def try_acquire(self) -> bool:
+        doc = self._update(
+            {'$set': {'granted': {'$gte': ['$tokens', 1]}}},
+            {'$set': {'tokens': {'$cond': ['$granted', {'$subtract': ['$tokens', 1]}, '$tokens']}}}
+        )
+        return doc['granted']
+
+
+def create_rate_limiter(
+    emails_per_minute: Optional[float] = None,
+    burst: Optional[int] = None,
+    key: Optional[str] = None
+) -> TokenBucket:
+    """
+    Create the rate limiter selected by Config.RATE_LIMIT_BACKEND
+
+    'local' limits this process only; 'mongodb' shares the bucket named by
+    key (default Config.RATE_LIMIT_KEY) with every process using it.
+    """
+    emails_per_minute = emails_per_minute or Config.RATE_LIMIT_EMAILS_PER_MINUTE
+    burst = burst or Config.RATE_LIMIT_BURST
+
+    if Config.RATE_LIMIT_BACKEND == 'mongodb':
+        return MongoTokenBucket(
+            mongodb.rate_limits,
+            key or Config.RATE_LIMIT_KEY,
+            emails_per_minute / 60,
+            burst
+        )
+    return TokenBucket.per_minute(emails_per_minute, burst)
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from typing import Dict, Mapping, Optional
+from config import Config
+from .mime_builder import MessageSkeleton
+from .template_service import CompiledTemplate
+
+
+class RenderedMessage:
+    """A personalized subject and body, with their encoded MIME bytes"""
+
+    __slots__ = ('subject', 'html', 'encoded')
+
+    def __init__(self, subject: str, html: str):
+        self.subject = subject
+        self.html = html
+        # (Subject header value, base64 body lines), ready for MessageSkeleton.assemble
+        self.encoded = (MessageSkeleton.encode_subject(subject), MessageSkeleton.encode_body(html))
+
+
+class RenderCache:
+    """
+    Rendered messages of one campaign, keyed by the merge values they use
+
+    Recipients whose values for the templates' merge fields are the same get
+    the same RenderedMessage, so the subject and body are rendered and
+    encoded once for all of them. Holds at most `max_entries` messages,
+    evicting the least recently used. Used from one thread.
+    """
+
+    def __init__(
+        self,
+        subject_template: CompiledTemplate,
+        body_template: CompiledTemplate,
+        max_entries: Optional[int] = None
+    ):
+        self.subject_template = subject_template
+        self.body_template = body_template
+        self.variables = tuple(dict.fromkeys(subject_template.variables + body_template.variables))
+        self.max_entries = Config.RENDER_CACHE_SIZE if max_entries is None else max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[tuple, RenderedMessage]' = OrderedDict()
+
+    def render(self, recipient: Mapping) -> RenderedMessage:
+        """The recipient's message, rendered or taken from the cache"""
+        try:
+            key = tuple([recipient[name] for name in self.variables])
+            message = self._entries.get(key)
+        except (KeyError, TypeError):
+            # Missing fields raise from the templates below, as without the cache;
+            # unhashable values are rendered every time
+            key = message = None
+
+        if message is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return message
+
+        self.misses += 1
+        message = RenderedMessage(self.subject_template.render(recipient), self.body_template.render(recipient))
+        if key is not None and self.max_entries:
+            self._entries[key] = message
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return message
+
+    def stats(self) -> Dict:
+        """Hits, misses and hit rate so far"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,346 @@
+import smtplib
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional
+import aiosmtplib
+from pymongo.errors import DuplicateKeyError
+from config import Config
+from database import mongodb
+from .adaptive_rate import AdaptiveRateController
+from .rate_limiter import create_rate_limiter
+from .smtp_pool import SMTPConnectionPool
+
+
+class DailyQuota:
+    """
+    Sends per day allowed to one sender account, counted in MongoDB
+
+    The count is one {shard, date} document shared by every process using
+    the account, so restarts and parallel workers do not each get a fresh
+    quota. A reservation is a single atomic $inc that only matches while
+    the count stays within the quota; once it fails the account is treated
+    as exhausted locally until the day changes.
+    """
+
+    def __init__(self, collection, key: str, limit: int):
+        self.collection = collection
+        self.key = key
+        self.limit = limit
+        self._exhausted_on = None
+
+    @staticmethod
+    def _today() -> str:
+        return date.today().isoformat()
+
+    @property
+    def exhausted(self) -> bool:
+        """A reservation already failed today"""
+        return self._exhausted_on == self._today()
+
+    def try_reserve(self, count: int = 1) -> bool:
+        """
+        Count `count` sends against today's quota if they all fit
+
+        A batch larger than what is left is refused without marking the
+        account exhausted, so single messages can still use the rest.
+        """
+        today = self._today()
+        if self._exhausted_on == today:
+            return False
+        try:
+            # When the count is too high the filter misses and the upsert
+            # collides with today's document on _id
+            self.collection.update_one(
+                {'_id': f"{self.key}:{today}", 'sent': {'$lte': self.limit - count}},
+                {'$inc': {'sent': count}, '$setOnInsert': {'shard': self.key, 'date': today}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            if count == 1:
+                self._exhausted_on = today
+            return False
+
+    def release(self, count: int = 1):
+        """Give back reserved sends that were not delivered"""
+        self.collection.update_one(
+            {'_id': f"{self.key}:{self._today()}", 'sent': {'$gte': count}},
+            {'$inc': {'sent': -count}}
+        )
+
+
+class SenderShard:
+    """One sender identity and relay with its own pool, rate limiter and daily quota"""
+
+    def __init__(
+        self,
+        name: str,
+        email: str,
+        password: str,
+        smtp_server: Optional[str] = None,
+        smtp_port: Optional[int] = None,
+        rate_per_minute: Optional[float] = None,
+        daily_quota: Optional[int] = None,
+        weight: int = 1,
+        rate_limit_key: Optional[str] = None
+    ):
+        """
+        Args:
+            daily_quota: Sends per day, counted in MongoDB across
+                processes; None for no quota
+            rate_limit_key: Name of the shared bucket when
+                RATE_LIMIT_BACKEND is 'mongodb', also naming the daily
+                quota count; defaults to smtp:<email>
+        """
+        self.name = name
+        self.email = email
+        self.password = password
+        self.smtp_server = smtp_server or Config.SMTP_SERVER
+        self.smtp_port = smtp_port or Config.SMTP_PORT
+        self.rate_per_minute = rate_per_minute or Config.RATE_LIMIT_EMAILS_PER_MINUTE
+        self.daily_quota = daily_quota
+        self.weight = max(1, weight)
+
+        self.pool = self._create_pool(max(Config.SMTP_POOL_SIZE, Config.SEND_CONCURRENCY))
+        key = rate_limit_key or f"smtp:{email}"
+        self.limiter = create_rate_limiter(self.rate_per_minute, key=key)
+        self.quota = DailyQuota(mongodb.sender_quotas, key, daily_quota) if daily_quota else None
+        self.controller = self._create_controller() if Config.ADAPTIVE_RATE_ENABLED else None
+
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SenderShard':
+        """Create a shard from a SENDER_ACCOUNTS entry"""
+        return cls(
+            name=data.get('name') or data['email'],
+            email=data['email'],
+            password=data['password'],
+            smtp_server=data.get('smtp_server'),
+            smtp_port=data.get('smtp_port'),
+            rate_per_minute=data.get('rate_per_minute'),
+            daily_quota=data.get('daily_quota'),
+            weight=int(data.get('weight', 1)),
+            rate_limit_key=data.get('rate_limit_key')
+        )
+
+    def _create_pool(self, size: int) -> SMTPConnectionPool:
+        """Create an SMTP connection pool with the configured recycle limits"""
+        return SMTPConnectionPool(
+            self.connect,
+            max_size=size,
+            max_messages=Config.SMTP_MAX_MESSAGES_PER_CONNECTION,
+            max_age=Config.SMTP_MAX_CONNECTION_AGE,
+            noop_after_idle=Config.SMTP_NOOP_AFTER_IDLE
+        )
+
+    def _create_controller(self) -> AdaptiveRateController:
+        """Create the AIMD controller for this shard's limiter"""
+        return AdaptiveRateController(
+            self.limiter,
+            min_per_minute=Config.ADAPTIVE_RATE_MIN_PER_MINUTE,
+            max_per_minute=max(Config.ADAPTIVE_RATE_MAX_PER_MINUTE, self.rate_per_minute),
+            increase=Config.ADAPTIVE_RATE_INCREASE,
+            decrease_factor=Config.ADAPTIVE_RATE_DECREASE_FACTOR,
+            cooldown=Config.ADAPTIVE_RATE_COOLDOWN
+        )
+
+    def ensure_pool_size(self, size: int):
+        """Grow the connection pool so `size` sessions can be open at once"""
+        if size > self.pool.max_size:
+            self.pool.close()
+            self.pool = self._create_pool(size)
+
+    def connect(self) -> smtplib.SMTP:
+        """Create and return an authenticated SMTP connection"""
+        try:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+            server.starttls()
+            server.login(self.email, self.password)
+            return server
+        except Exception as e:
+            raise Exception(f"Failed to connect to SMTP server: {str(e)}") from e
+
+    async def connect_async(self) -> aiosmtplib.SMTP:
+        """Open and authenticate an asyncio SMTP session"""
+        try:
+            smtp = aiosmtplib.SMTP(
+                hostname=self.smtp_server,
+                port=self.smtp_port,
+                start_tls=True
+            )
+            await smtp.connect()
+            await smtp.login(self.email, self.password)
+            return smtp
+        except Exception as e:
+            raise Exception(f"Failed to connect to SMTP server: {str(e)}") from e
+
+    def _transmit(self, server: smtplib.SMTP, msg, to_addrs: Optional[List[str]]) -> Dict:
+        """Send a MIME message, or raw message bytes to the given recipients"""
+        if isinstance(msg, bytes):
+            return server.sendmail(self.email, to_addrs, msg)
+        return server.send_message(msg)
+
+    def send_message(self, msg, use_pool: bool = True, to_addrs: Optional[List[str]] = None) -> Dict:
+        """
+        Send a message, over a pooled session reconnecting once if it was dropped
+
+        Args:
+            msg: MIME message, or raw message bytes (then to_addrs is required)
+            to_addrs: Envelope recipients for raw messages
+
+        Returns:
+            Recipients the server refused at RCPT TO while accepting others,
+            as address -> (code, message)
+
+        Raises:
+            smtplib.SMTPRecipientsRefused: If every recipient was refused
+        """
+        if not use_pool:
+            server = self.connect()
+            try:
+                return self._transmit(server, msg, to_addrs)
+            finally:
+                try:
+                    server.quit()
+                except (smtplib.SMTPException, OSError):
+                    try:
+                        server.close()
+                    except OSError:
+                        pass
+
+        for attempt in range(2):
+            try:
+                with self.pool.connection() as conn:
+                    refused = self._transmit(conn.server, msg, to_addrs)
+                    conn.messages_sent += 1
+                return refused
+            except smtplib.SMTPServerDisconnected:
+                if attempt:
+                    raise
+
+    @property
+    def current_rate(self) -> float:
+        """Emails per minute currently allowed for this shard"""
+        return self.limiter.rate * 60
+
+    def has_quota(self) -> bool:
+        """Check that the daily quota is not known to be used up (no database round trip)"""
+        return self.quota is None or not self.quota.exhausted
+
+    def reserve_quota(self, count: int = 1) -> bool:
+        """Count `count` upcoming sends against the daily quota if they fit"""
+        return self.quota is None or self.quota.try_reserve(count)
+
+    def is_healthy(self) -> bool:
+        """Check that the shard is not benched after repeated failures"""
+        return time.monotonic() >= self.unhealthy_until
+
+    def record(self, success: bool, transient: bool, sender_fault: bool) -> float:
+        """
+        Update rate, quota and health after a send through this shard
+
+        A failed send gives its reserved quota back.
+
+        Returns:
+            Cooldown in seconds started by a throttling reply (0 if none)
+        """
+        with self._lock:
+            if success:
+                self.consecutive_failures = 0
+            elif sender_fault:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= Config.SHARD_MAX_CONSECUTIVE_FAILURES:
+                    self.unhealthy_until = time.monotonic() + Config.SHARD_UNHEALTHY_COOLDOWN
+                    self.consecutive_failures = 0
+        if not success and self.quota is not None:
+            self.quota.release()
+
+        if self.controller:
+            if success:
+                self.controller.on_success()
+            elif transient:
+                return self.controller.on_throttle()
+        return 0
+
+    def close(self):
+        """Close idle pooled sessions"""
+        self.pool.close()
+
+
+class ShardRouter:
+    """
+    Smooth weighted round-robin over sender shards
+
+    Shards that are unhealthy or out of daily quota are skipped until they
+    recover; messages that failed on a benched shard move to the others.
+    """
+
+    def __init__(self, shards: List[SenderShard]):
+        if not shards:
+            raise ValueError("At least one sender account is required")
+        self.shards = shards
+        self._current = {shard.name: 0 for shard in shards}
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self) -> SenderShard:
+        """Shard used for single messages such as test emails"""
+        return self.shards[0]
+
+    def available(self) -> List[SenderShard]:
+        """
+        Shards that can take the next message
+
+        Healthy shards with quota left; if every shard with quota is
+        benched, all of them, so a campaign keeps moving (and failing fast)
+        rather than stalling.
+        """
+        with_quota = [s for s in self.shards if s.has_quota()]
+        healthy = [s for s in with_quota if s.is_healthy()]
+        return healthy or with_quota
+
+    def choose(self, count: int = 1) -> Optional[SenderShard]:
+        """
+        Pick the next shard and reserve `count` sends of its daily quota
+
+        Returns:
+            The shard, or None if no shard has quota left for `count` sends
+        """
+        with self._lock:
+            candidates = self.available()
+            while candidates:
+                total = sum(s.weight for s in candidates)
+                for shard in candidates:
+                    self._current[shard.name] += shard.weight
+                chosen = max(candidates, key=lambda s: self._current[s.name])
+                self._current[chosen.name] -= total
+                if chosen.reserve_quota(count):
+                    return chosen
+                candidates.remove(chosen)
+            return None
+
+    @property
+    def rate_per_minute(self) -> float:
+        """Combined rate of the shards that can currently send"""
+        return sum(s.current_rate for s in self.available())
+
+    def close(self):
+        """Close idle pooled sessions of every shard"""
+        for shard in self.shards:
+            shard.close()
+
+
+def load_sender_shards() -> List[SenderShard]:
+    """Create shards from Config.SENDER_ACCOUNTS, or the single Gmail account"""
+    if Config.SENDER_ACCOUNTS:
+        return [SenderShard.from_dict(data) for data in Config.SENDER_ACCOUNTS]
+    return [SenderShard(
+        name=Config.GMAIL_EMAIL or 'default',
+        email=Config.GMAIL_EMAIL,
+        password=Config.GMAIL_APP_PASSWORD,
+        rate_limit_key=Config.RATE_LIMIT_KEY
+    )]
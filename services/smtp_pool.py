@@ -0,0 +1,172 @@
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+
+class PooledConnection:
+    """Authenticated SMTP session tracked by the pool"""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+    @property
+    def age(self) -> float:
+        """Seconds since the session was opened"""
+        return time.monotonic() - self.created_at
+
+    @property
+    def idle_time(self) -> float:
+        """Seconds since the session was last used"""
+        return time.monotonic() - self.last_used
+
+
+class SMTPConnectionPool:
+    """Pool of reusable, authenticated SMTP sessions"""
+
+    def __init__(
+        self,
+        connect: Callable[[], smtplib.SMTP],
+        max_size: int = 4,
+        max_messages: int = 100,
+        max_age: float = 300,
+        noop_after_idle: float = 5
+    ):
+        """
+        Args:
+            connect: Factory returning a connected, logged-in SMTP session
+            max_size: Maximum number of sessions open at the same time
+            max_messages: Recycle a session after this many messages
+            max_age: Recycle a session after this many seconds
+            noop_after_idle: Check a session with NOOP before reuse once it
+                has been idle for this many seconds
+        """
+        self._connect = connect
+        self.max_size = max_size
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.noop_after_idle = noop_after_idle
+
+        self._idle: List[PooledConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _is_expired(self, conn: PooledConnection) -> bool:
+        """Check whether a session has reached its recycle limits"""
+        if self.max_messages and conn.messages_sent >= self.max_messages:
+            return True
+        if self.max_age and conn.age >= self.max_age:
+            return True
+        return False
+
+    def _is_alive(self, conn: PooledConnection) -> bool:
+        """Check an idle session with NOOP"""
+        try:
+            code, _ = conn.server.noop()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(conn: PooledConnection):
+        """Close a session, ignoring errors from dropped connections"""
+        try:
+            conn.server.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                conn.server.close()
+            except OSError:
+                pass
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        Get a usable session, reusing an idle one when possible
+
+        Blocks while max_size sessions are checked out.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for an SMTP connection")
+
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+
+                if conn is None:
+                    return PooledConnection(self._connect())
+
+                if self._is_expired(conn):
+                    self._close(conn)
+                    continue
+
+                if conn.idle_time >= self.noop_after_idle and not self._is_alive(conn):
+                    self._close(conn)
+                    continue
+
+                return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: PooledConnection):
+        """Return a session to the pool, recycling it if it is worn out"""
+        conn.last_used = time.monotonic()
+        try:
+            if self._is_expired(conn):
+                self._close(conn)
+            else:
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def discard(self, conn: PooledConnection):
+        """Close a broken session and free its slot"""
+        try:
+            self._close(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager yielding a pooled session
+
+        The session is discarded instead of returned if the block raises
+        a dropped-connection or socket error. SMTP error replies (e.g. a
+        refused recipient) leave the session usable, since smtplib resets
+        the transaction, so it goes back to the pool unless smtplib closed it.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except smtplib.SMTPServerDisconnected:
+            self.discard(conn)
+            raise
+        except smtplib.SMTPException:
+            # SMTPException subclasses OSError; replies are not broken sockets,
+            # but smtplib closes the socket itself after a 421
+            if getattr(conn.server, 'sock', None) is None:
+                self.discard(conn)
+            else:
+                self.release(conn)
+            raise
+        except OSError:
+            self.discard(conn)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        """Close all idle sessions"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
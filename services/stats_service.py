@@ -0,0 +1,177 @@
+"""
+Pre-aggregated send statistics
+
+Counter documents in the `stats` collection (global and per day) are
+incremented as email logs land, so pages read a few small documents instead
+of counting `email_logs`. Per-campaign counters are the campaigns'
+sent_count and failed_count. Recompute every counter from `email_logs` with:
+
+    python -m services.stats_service rebuild
+
+A database that already has email logs needs one rebuild before the
+counters are trusted; until then get_global reports needs_rebuild. The
+rebuild is never run from a page.
+"""
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from database import mongodb
+
+GLOBAL_ID = 'global'
+
+# Log status -> counter field
+_FIELDS = {'sent': 'sent', 'failed': 'failed'}
+
+
+def _day_id(day: str) -> str:
+    return f"day:{day}"
+
+
+class StatsService:
+    """Global, daily and per-campaign send counters"""
+
+    def __init__(self, db=None):
+        self.db = db or mongodb
+
+    def record_campaign(self):
+        """Count a newly created campaign"""
+        self.db.stats.update_one({'_id': GLOBAL_ID}, {'$inc': {'campaigns': 1}}, upsert=True)
+
+    def record_logs(self, logs: Iterable[Dict]):
+        """Add stored email logs to the global and daily counters"""
+        totals = Counter()
+        days = Counter()
+        for log in logs:
+            field = _FIELDS.get(log['status'])
+            if field is None:
+                continue
+            totals[field] += 1
+            days[(log['sent_at'].strftime('%Y-%m-%d'), field)] += 1
+        if not totals:
+            return
+
+        operations = [UpdateOne({'_id': GLOBAL_ID}, {'$inc': dict(totals)}, upsert=True)]
+        per_day = {}
+        for (day, field), count in days.items():
+            per_day.setdefault(day, {})[field] = count
+        operations += [
+            UpdateOne({'_id': _day_id(day)}, {'$inc': increments, '$set': {'date': day}}, upsert=True)
+            for day, increments in per_day.items()
+        ]
+        self.db.stats.bulk_write(operations, ordered=False)
+
+    def get_global(self) -> Dict:
+        """
+        Total campaigns, sent and failed emails
+
+        needs_rebuild is True while the counters have never been rebuilt and
+        there are email logs they may be missing. A database without logs is
+        marked as rebuilt here, since there is nothing to backfill.
+        """
+        stats = self.db.stats.find_one({'_id': GLOBAL_ID}) or {}
+        needs_rebuild = 'rebuilt_at' not in stats
+        if needs_rebuild and self.db.email_logs.find_one({}, {'_id': 1}) is None:
+            self.db.stats.update_one(
+                {'_id': GLOBAL_ID},
+                {
+                    '$set': {'rebuilt_at': datetime.now(timezone.utc)},
+                    '$max': {'campaigns': self.db.campaigns.count_documents({})}
+                },
+                upsert=True
+            )
+            stats = self.db.stats.find_one({'_id': GLOBAL_ID}) or {}
+            needs_rebuild = False
+        return {
+            'campaigns': stats.get('campaigns', 0),
+            'sent': stats.get('sent', 0),
+            'failed': stats.get('failed', 0),
+            'needs_rebuild': needs_rebuild
+        }
+
+    def get_daily(self, days: int = 30) -> List[Dict]:
+        """Daily sent/failed counters for the last `days` days, oldest first"""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        cursor = self.db.stats.find(
+            {'_id': {'$gte': _day_id(since), '$lt': _day_id('~')}},
+            {'_id': 0, 'date': 1, 'sent': 1, 'failed': 1}
+        ).sort('_id', 1)
+        return [
+            {'date': doc['date'], 'sent': doc.get('sent', 0), 'failed': doc.get('failed', 0)}
+            for doc in cursor
+        ]
+
+    def rebuild(self):
+        """Recompute every counter from email_logs and the campaigns collection"""
+        logs = self.db.email_logs
+
+        totals = {'sent': 0, 'failed': 0}
+        for row in logs.aggregate([
+            {'$match': {'status': {'$in': list(_FIELDS)}}},
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}}}
+        ], allowDiskUse=True):
+            totals[_FIELDS[row['_id']]] = row['count']
+
+        per_day = {}
+        for row in logs.aggregate([
+            {'$match': {'status': {'$in': list(_FIELDS)}}},
+            {'$group': {
+                '_id': {
+                    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$sent_at'}},
+                    'status': '$status'
+                },
+                'count': {'$sum': 1}
+            }}
+        ], allowDiskUse=True):
+            day = row['_id']['day']
+            per_day.setdefault(day, {'date': day, 'sent': 0, 'failed': 0})[_FIELDS[row['_id']['status']]] = row['count']
+
+        per_campaign = {}
+        for row in logs.aggregate([
+            {'$match': {'status': {'$in': list(_FIELDS)}}},
+            {'$group': {'_id': {'campaign_id': '$campaign_id', 'status': '$status'}, 'count': {'$sum': 1}}}
+        ], allowDiskUse=True):
+            campaign_id = row['_id']['campaign_id']
+            counts = per_campaign.setdefault(campaign_id, {'sent_count': 0, 'failed_count': 0})
+            counts[f"{_FIELDS[row['_id']['status']]}_count"] = row['count']
+
+        self.db.stats.delete_many({'_id': {'$gte': _day_id(''), '$lt': _day_id('~')}})
+        operations = [UpdateOne(
+            {'_id': GLOBAL_ID},
+            {'$set': {
+                'campaigns': self.db.campaigns.count_documents({}),
+                'rebuilt_at': datetime.now(timezone.utc),
+                **totals
+            }},
+            upsert=True
+        )]
+        operations += [
+            UpdateOne({'_id': _day_id(day)}, {'$set': counts}, upsert=True)
+            for day, counts in per_day.items()
+        ]
+        self.db.stats.bulk_write(operations, ordered=False)
+
+        campaign_updates = [
+            UpdateOne({'_id': ObjectId(campaign_id)}, {'$set': counts})
+            for campaign_id, counts in per_campaign.items()
+            if ObjectId.is_valid(campaign_id)
+        ]
+        if campaign_updates:
+            self.db.campaigns.bulk_write(campaign_updates, ordered=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain pre-aggregated send statistics")
+    parser.add_argument('command', choices=['rebuild'], help="rebuild: recompute all counters from email_logs")
+    parser.parse_args()
+
+    if not mongodb.connect():
+        raise SystemExit("Failed to connect to MongoDB")
+    StatsService().rebuild()
+    print("Statistics rebuilt")
+
+
+if __name__ == '__main__':
+    main()
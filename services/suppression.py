@@ -0,0 +1,236 @@
+"""
+Suppression list: addresses that must never be mailed again
+
+Unsubscribes, hard bounces and complaints are stored in the `suppressions`
+collection, one document per normalized (trimmed, lowercased) address.
+Each process keeps them as a sorted array of 64-bit address hashes,
+refreshed incrementally from the documents changed since the last refresh,
+and uploads are deduplicated and filtered against it in one vectorized
+pass. Manage the list from the command line with:
+
+    python -m services.suppression add <email>... [--reason unsubscribed]
+    python -m services.suppression remove <email>...
+    python -m services.suppression import <file.csv> [--reason hard_bounce]
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Tuple
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+from config import Config
+from database import mongodb
+from utils import CSVParser
+
+# Why an address is suppressed; stored as its position + 1 in memory
+REASONS = ('unsubscribed', 'hard_bounce', 'complaint', 'manual')
+_REASON_CODES = {reason: code for code, reason in enumerate(REASONS, start=1)}
+
+# Reason reported for repeated addresses within an upload
+DUPLICATE = 'duplicate'
+
+# Changes are re-read this far back, so writes that commit out of order are not missed
+_REFRESH_OVERLAP = timedelta(seconds=60)
+
+# Addresses per bulk write
+_WRITE_BATCH_SIZE = 1000
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def normalize_emails(emails: pd.Series) -> pd.Series:
+    """Trimmed, lowercased addresses"""
+    return emails.astype(str).str.strip().str.lower()
+
+
+def hash_emails(normalized: Iterable[str]) -> np.ndarray:
+    """64-bit hashes of normalized addresses, stable across processes"""
+    return pd.util.hash_array(np.array(normalized, dtype=object), categorize=False)
+
+
+class SuppressionList:
+    """
+    In-memory index of suppressed addresses, backed by MongoDB
+
+    Holds 9 bytes per address: its hash and reason code. A hash collision
+    can only suppress an address wrongly, never let a suppressed one through.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or mongodb
+        # (sorted address hashes, reason codes), replaced as a whole on refresh
+        self._index = (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint8))
+        self._synced_to = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> 'SuppressionList':
+        """The process-wide list, refreshed if Config.SUPPRESSION_REFRESH_INTERVAL has passed"""
+        global _shared
+        with _shared_lock:
+            if _shared is None:
+                _shared = cls()
+        _shared.refresh_if_due()
+        return _shared
+
+    def __len__(self) -> int:
+        return len(self._index[0])
+
+    def add(self, emails: Iterable[str], reason: str = 'manual') -> int:
+        """
+        Suppress addresses, or change why they are suppressed
+
+        Returns:
+            Number of addresses written
+
+        Raises:
+            ValueError: For an unknown reason
+        """
+        if reason not in REASONS:
+            raise ValueError(f"Unknown suppression reason: {reason}")
+        now = datetime.now(timezone.utc)
+        return self._write([
+            UpdateOne(
+                {'_id': email},
+                {
+                    '$set': {'reason': reason, 'active': True, 'updated_at': now},
+                    '$setOnInsert': {'added_at': now}
+                },
+                upsert=True
+            )
+            for email in self._normalize(emails)
+        ])
+
+    def remove(self, emails: Iterable[str]) -> int:
+        """
+        Lift the suppression of addresses, e.g. after they subscribe again
+
+        Kept as inactive documents so other processes see the change on their
+        next incremental refresh.
+
+        Returns:
+            Number of addresses written
+        """
+        now = datetime.now(timezone.utc)
+        return self._write([
+            UpdateOne({'_id': email}, {'$set': {'active': False, 'updated_at': now}})
+            for email in self._normalize(emails)
+        ])
+
+    @staticmethod
+    def _normalize(emails: Iterable[str]) -> list:
+        """Distinct, non-empty normalized addresses"""
+        normalized = normalize_emails(pd.Series(list(emails), dtype=object))
+        return [email for email in normalized.unique() if email]
+
+    def _write(self, operations: list) -> int:
+        for start in range(0, len(operations), _WRITE_BATCH_SIZE):
+            self.db.suppressions.bulk_write(operations[start:start + _WRITE_BATCH_SIZE], ordered=False)
+        self.refresh()
+        return len(operations)
+
+    def refresh(self):
+        """Apply the suppressions added, changed or lifted since the last refresh"""
+        with self._lock:
+            query = {}
+            if self._synced_to is not None:
+                query['updated_at'] = {'$gte': self._synced_to - _REFRESH_OVERLAP}
+            cursor = self.db.suppressions.find(query, {'reason': 1, 'active': 1, 'updated_at': 1})
+            if self._synced_to is not None:
+                cursor = cursor.sort('updated_at', 1)
+            changes = list(cursor)
+            self._refreshed_at = time.monotonic()
+            if not changes:
+                return
+
+            self._synced_to = max(doc['updated_at'] for doc in changes)
+            changed = hash_emails([doc['_id'] for doc in changes])
+            active = np.array([doc.get('active', True) for doc in changes], dtype=bool)
+            codes = np.array(
+                [_REASON_CODES.get(doc.get('reason'), _REASON_CODES['manual']) for doc in changes],
+                dtype=np.uint8
+            )
+
+            # Drop the old entries of changed addresses, then add the active ones back
+            known, known_codes = self._index
+            keep = ~np.isin(known, changed)
+            hashes = np.concatenate([known[keep], changed[active]])
+            codes = np.concatenate([known_codes[keep], codes[active]])
+            hashes, unique = np.unique(hashes, return_index=True)
+            self._index = (hashes, codes[unique])
+
+    def refresh_if_due(self):
+        """Refresh when Config.SUPPRESSION_REFRESH_INTERVAL seconds have passed"""
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= Config.SUPPRESSION_REFRESH_INTERVAL:
+            self.refresh()
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """Reason code for each address hash: 0 if not suppressed, else its position in REASONS + 1"""
+        known, known_codes = self._index
+        if not len(known):
+            return np.zeros(len(hashes), dtype=np.uint8)
+        positions = np.minimum(np.searchsorted(known, hashes), len(known) - 1)
+        return np.where(known[positions] == hashes, known_codes[positions], 0).astype(np.uint8)
+
+    def filter(self, emails: pd.Series) -> Tuple[np.ndarray, Dict[str, int]]:
+        """
+        Find the addresses to drop from an upload: suppressed ones and repeats
+
+        Args:
+            emails: The upload's email column
+
+        Returns:
+            Tuple of (keep: boolean mask over `emails`, removed: Dict of reason -> count).
+            Suppressed addresses are reported under their suppression reason,
+            later copies of other addresses as 'duplicate'.
+        """
+        hashes = hash_emails(normalize_emails(emails))
+        duplicate = pd.Series(hashes).duplicated().to_numpy()
+        codes = self.lookup(hashes)
+
+        keep = (codes == 0) & ~duplicate
+
+        removed = {}
+        counts = np.bincount(codes, minlength=len(REASONS) + 1)
+        for code, reason in enumerate(REASONS, start=1):
+            if counts[code]:
+                removed[reason] = int(counts[code])
+        duplicates = int(np.count_nonzero(duplicate & (codes == 0)))
+        if duplicates:
+            removed[DUPLICATE] = duplicates
+        return keep, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage suppressed email addresses")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add = subparsers.add_parser('add', help="Suppress addresses")
+    add.add_argument('emails', nargs='+')
+    add.add_argument('--reason', choices=REASONS, default='manual')
+    remove = subparsers.add_parser('remove', help="Lift the suppression of addresses")
+    remove.add_argument('emails', nargs='+')
+    import_ = subparsers.add_parser('import', help="Suppress every address in a CSV file's email column")
+    import_.add_argument('file')
+    import_.add_argument('--reason', choices=REASONS, default='manual')
+    args = parser.parse_args()
+
+    if not mongodb.connect():
+        raise SystemExit("Failed to connect to MongoDB")
+    suppressions = SuppressionList()
+    if args.command == 'add':
+        count = suppressions.add(args.emails, args.reason)
+    elif args.command == 'remove':
+        count = suppressions.remove(args.emails)
+    else:
+        count = 0
+        for chunk in CSVParser.iter_csv_chunks(args.file):
+            count += suppressions.add(chunk['email'], args.reason)
+    print(f"{args.command}: {count} address(es)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,103 @@
+import hashlib
 import re
-from typing import List, Dict
+import threading
+from collections import OrderedDict
+from string import Formatter
+from typing import List, Dict, Mapping
+from config import Config
 from database import mongodb
 from models import Template
 
+
+class CompiledTemplate:
+    """
+    Template pre-split into literal and field segments
+    
+    Rendering is a single join over the segments and gives exactly the same
+    output (and errors) as template.format(**data). Plain {name} fields are
+    looked up directly; fields with attributes, indexes, conversions or
+    format specs fall back to str.format for that field only.
+    """
+    
+    __slots__ = ('source', 'segments', 'fields', 'variables')
+    
+    def __init__(self, source: str):
+        self.source = source
+        segments = []
+        fields = []
+        variables = []
+        for literal, field_name, format_spec, conversion in Formatter().parse(source):
+            if field_name is None:
+                segments.append((literal, None))
+            elif field_name.isidentifier() and not format_spec and not conversion:
+                segments.append((literal, field_name))
+                fields.append(field_name)
+                variables.append(field_name)
+            else:
+                segments.append((literal, self._field_formatter(field_name, format_spec, conversion)))
+                variables.append(self._root(field_name))
+                # Format specs may nest fields themselves, e.g. {amount:{width}}
+                for _, nested, _, _ in Formatter().parse(format_spec or ''):
+                    if nested is not None:
+                        variables.append(self._root(nested))
+        self.segments = tuple(segments)
+        # Plain {name} fields, and every merge field the output depends on
+        self.fields = tuple(dict.fromkeys(fields))
+        self.variables = tuple(dict.fromkeys(variables))
+    
+    @staticmethod
+    def _root(field_name: str) -> str:
+        """Merge field a field expression reads, e.g. 'user' for user.name or user[0]"""
+        return re.match(r'[^.\[]*', field_name).group()
+    
+    @staticmethod
+    def _field_formatter(field_name: str, format_spec: str, conversion: str):
+        """Render one complex field exactly as str.format would"""
+        piece = '{' + field_name
+        if conversion:
+            piece += '!' + conversion
+        if format_spec:
+            piece += ':' + format_spec
+        piece += '}'
+        return lambda data: piece.format(**data)
+    
+    def render(self, data: Mapping) -> str:
+        """Render the template with the given merge fields"""
+        parts = []
+        append = parts.append
+        for literal, field in self.segments:
+            if literal:
+                append(literal)
+            if field is None:
+                continue
+            if type(field) is str:
+                value = data[field]
+                append(value if type(value) is str else format(value, ''))
+            else:
+                append(field(data))
+        return ''.join(parts)
+
+
+_compiled_cache: 'OrderedDict[bytes, CompiledTemplate]' = OrderedDict()
+_compiled_cache_lock = threading.Lock()
+
+
+def compile_template(source: str) -> CompiledTemplate:
+    """Compile a template, memoized in an LRU keyed by a hash of its content"""
+    key = hashlib.blake2b(source.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    with _compiled_cache_lock:
+        compiled = _compiled_cache.get(key)
+        if compiled is not None:
+            _compiled_cache.move_to_end(key)
+            return compiled
+    
+    compiled = CompiledTemplate(source)
+    with _compiled_cache_lock:
+        _compiled_cache[key] = compiled
+        while len(_compiled_cache) > Config.TEMPLATE_CACHE_SIZE:
+            _compiled_cache.popitem(last=False)
+    return compiled
+
 class TemplateService:
     """Email template management service"""
     
@@ -47,10 +142,15 @@ class TemplateService:
         variables = re.findall(pattern, content)
         return list(set(variables))  # Remove duplicates
     
+    @staticmethod
+    def compile_template(content: str) -> CompiledTemplate:
+        """Compile template content once for repeated rendering"""
+        return compile_template(content)
+    
     def render_template(self, template_html: str, data: Dict) -> str:
         """Render template with provided data"""
         try:
-            return template_html.format(**data)
+            return compile_template(template_html).render(data)
         except KeyError as e:
             raise ValueError(f"Missing required variable: {str(e)}")
     
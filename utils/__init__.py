@@ -1,4 +1,7 @@
 """Utilities package initialization"""
-from .csv_parser import CSVParser
+from .csv_parser import CSVFormatError, CSVParser
+from .merge_context import MergeContext, MergeView
+from .recipient_store import RecipientRow, RecipientStore
+from .upload_cache import UploadCache
 
-__all__ = ['CSVParser']
+__all__ = ['CSVFormatError', 'CSVParser', 'MergeContext', 'MergeView', 'RecipientRow', 'RecipientStore', 'UploadCache']
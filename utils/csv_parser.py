@@ -1,7 +1,87 @@
 import pandas as pd
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple
 import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from email_validator import validate_email, EmailNotValidError
+from config import Config
+from .merge_context import MergeContext
+
+class CSVFormatError(ValueError):
+    """The CSV file cannot be used as a recipient list"""
+
+
+# Cheap vectorized checks, applied before full validation. Each one only
+# matches addresses that email_validator rejects as well.
+_PREFILTER_RULES = [
+    ('Missing @-sign', r'^[^@]*$'),
+    ('More than one @-sign', r'@.*@'),
+    ('Nothing before the @-sign', r'^@'),
+    ('Contains whitespace', r'\s'),
+    # IDNA also accepts the ideographic and fullwidth full stops
+    ('No period after the @-sign', '@[^.\u3002\uff0e\uff61]*$'),
+]
+
+# Addresses per task sent to a validation worker process
+_VALIDATION_CHUNK_SIZE = 1000
+
+
+def _validate_chunk(emails: List[str]) -> List[Optional[str]]:
+    """Fully validate addresses; None for valid ones, the reason for invalid ones"""
+    reasons = []
+    for email in emails:
+        try:
+            validate_email(email, check_deliverability=False)
+            reasons.append(None)
+        except EmailNotValidError as e:
+            reasons.append(str(e))
+    return reasons
+
+
+class _ValidationPool:
+    """
+    Worker processes for full validation, started on first use and reused
+
+    One pool serves a whole parse, so a file read in chunks starts its
+    workers once. Workers are not forked from the (multithreaded) server
+    process: they come from a fork server where available, else are spawned.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._unavailable = False
+
+    def validate(self, emails: List[str]) -> List[Optional[str]]:
+        """Validate unique addresses, in the pool when there are many"""
+        if len(emails) < Config.VALIDATION_PARALLEL_THRESHOLD or self._unavailable:
+            return _validate_chunk(emails)
+        chunks = [emails[i:i + _VALIDATION_CHUNK_SIZE] for i in range(0, len(emails), _VALIDATION_CHUNK_SIZE)]
+        try:
+            if self._executor is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._executor = ProcessPoolExecutor(
+                    max_workers=Config.VALIDATION_WORKERS,
+                    mp_context=multiprocessing.get_context(method)
+                )
+            return [reason for chunk in self._executor.map(_validate_chunk, chunks) for reason in chunk]
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Parallel email validation unavailable, validating serially: {str(e)}")
+            self.close()
+            self._unavailable = True
+            return _validate_chunk(emails)
+
+    def close(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 class CSVParser:
     """CSV file parser and validator"""
@@ -11,37 +91,99 @@ class CSVParser:
         """
         Parse uploaded CSV file
         
+        Values are read as strings, so numbers keep their exact spelling
+        (e.g. leading zeros) and missing values become empty strings.
+        
         Returns:
             Tuple of (success: bool, dataframe: pd.DataFrame, error_message: str)
         """
         try:
-            df = pd.read_csv(file)
+            chunks = list(CSVParser.iter_csv_chunks(file))
             
             # Check if empty
-            if df.empty:
+            if not chunks:
                 return False, None, "CSV file is empty"
             
-            # Check for email column
-            email_columns = [col for col in df.columns if 'email' in col.lower()]
-            if not email_columns:
-                return False, None, "CSV must contain an 'email' column"
-            
-            # Rename first email column to 'email' for consistency
-            if email_columns[0] != 'email':
-                df.rename(columns={email_columns[0]: 'email'}, inplace=True)
-            
-            # Remove rows with empty emails
-            df = df[df['email'].notna()]
-            df = df[df['email'].astype(str).str.strip() != '']
-            
-            # Fill NaN values with empty strings
-            df = df.fillna('')
+            df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+            if df.empty:
+                return False, None, "CSV file is empty"
             
             return True, df, ""
             
+        except pd.errors.EmptyDataError:
+            return False, None, "CSV file is empty"
+        except CSVFormatError as e:
+            return False, None, str(e)
         except Exception as e:
             return False, None, f"Error parsing CSV: {str(e)}"
     
+    @staticmethod
+    def iter_csv_chunks(file, chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Read a CSV file a chunk at a time, as strings
+        
+        The first email-like column is renamed to 'email' and rows without an
+        email are dropped from each chunk.
+        
+        Raises:
+            CSVFormatError: If the CSV has no email column
+        """
+        reader = pd.read_csv(
+            file,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunk_size or Config.CSV_CHUNK_SIZE
+        )
+        with reader:
+            email_column = None
+            for chunk in reader:
+                if email_column is None:
+                    # Check for email column
+                    email_columns = [col for col in chunk.columns if 'email' in col.lower()]
+                    if not email_columns:
+                        raise CSVFormatError("CSV must contain an 'email' column")
+                    email_column = email_columns[0]
+                
+                # Rename first email column to 'email' for consistency
+                if email_column != 'email':
+                    chunk = chunk.rename(columns={email_column: 'email'})
+                
+                # Remove rows with empty emails
+                yield chunk[chunk['email'].str.strip() != ''].reset_index(drop=True)
+    
+    @staticmethod
+    def iter_recipients(
+        file,
+        report: Optional[Dict] = None,
+        chunk_size: Optional[int] = None
+    ) -> Iterator[Dict]:
+        """
+        Stream validated recipients from a CSV file, one chunk in memory at a time
+        
+        Args:
+            report: Optional dict updated as chunks are read, with valid and
+                invalid counts, per-reason counts of rejected addresses and
+                the first Config.CSV_INVALID_SAMPLE_SIZE invalid addresses
+        
+        Raises:
+            CSVFormatError: If the CSV has no email column
+        """
+        if report is None:
+            report = {}
+        report.update({'valid': 0, 'invalid': 0, 'reasons': {}, 'invalid_emails': []})
+        
+        with _ValidationPool() as pool:
+            for chunk in CSVParser.iter_csv_chunks(file, chunk_size):
+                valid_df, invalid_emails, reasons = CSVParser.validate_emails_with_reasons(chunk, pool)
+                report['valid'] += len(valid_df)
+                report['invalid'] += len(invalid_emails)
+                for reason, count in reasons.items():
+                    report['reasons'][reason] = report['reasons'].get(reason, 0) + count
+                room = Config.CSV_INVALID_SAMPLE_SIZE - len(report['invalid_emails'])
+                report['invalid_emails'].extend(invalid_emails[:max(0, room)])
+                
+                yield from valid_df.to_dict('records')
+    
     @staticmethod
     def validate_emails(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
         """
@@ -50,21 +192,50 @@ class CSVParser:
         Returns:
             Tuple of (valid_df: pd.DataFrame, invalid_emails: List[str])
         """
-        invalid_emails = []
-        valid_indices = []
+        valid_df, invalid_emails, _ = CSVParser.validate_emails_with_reasons(df)
+        return valid_df, invalid_emails
+    
+    @staticmethod
+    def validate_emails_with_reasons(
+        df: pd.DataFrame,
+        pool: Optional[_ValidationPool] = None
+    ) -> Tuple[pd.DataFrame, List[str], Dict[str, int]]:
+        """
+        Validate email addresses in dataframe, counting why addresses were rejected
         
-        for idx, row in df.iterrows():
-            email = row['email'].strip()
-            try:
-                # Validate email
-                validate_email(email, check_deliverability=False)
-                valid_indices.append(idx)
-            except EmailNotValidError:
-                invalid_emails.append(email)
+        Malformed addresses are rejected by vectorized checks first; each
+        remaining distinct address is then fully validated once.
         
-        valid_df = df.loc[valid_indices].reset_index(drop=True)
+        Args:
+            pool: Validation workers shared across the chunks of one parse;
+                a pool is started and stopped for this call when not given
         
-        return valid_df, invalid_emails
+        Returns:
+            Tuple of (valid_df: pd.DataFrame, invalid_emails: List[str], reasons: Dict[str, int])
+        """
+        emails = df['email'].astype(str).str.strip()
+        
+        # Vectorized prefilter; the first matching rule is the reason
+        reasons = pd.Series(None, index=df.index, dtype=object)
+        for reason, pattern in _PREFILTER_RULES:
+            matches = emails.str.contains(pattern, regex=True) & reasons.isna()
+            reasons[matches] = reason
+        
+        # Full validation of each distinct surviving address
+        survivors = pd.unique(emails[reasons.isna()]).tolist()
+        if pool is None:
+            with _ValidationPool() as pool:
+                validated = pool.validate(survivors)
+        else:
+            validated = pool.validate(survivors)
+        results = dict(zip(survivors, validated))
+        reasons = reasons.where(reasons.notna(), emails.map(results))
+        
+        invalid = reasons.notna()
+        valid_df = df[~invalid].reset_index(drop=True)
+        invalid_emails = emails[invalid].tolist()
+        
+        return valid_df, invalid_emails, reasons[invalid].value_counts().to_dict()
     
     @staticmethod
     def get_column_preview(df: pd.DataFrame, max_rows: int = 5) -> str:
@@ -96,20 +267,4 @@ class CSVParser:
     @staticmethod
     def create_sample_data(recipient_dict: Dict) -> Dict:
         """Create sample data for template preview"""
-        sample = recipient_dict.copy()
-        
-        # Add default values for common fields if not present
-        defaults = {
-            'name': sample.get('name', 'John Doe'),
-            'company': sample.get('company', 'Example Corp'),
-            'sender_name': 'Your Company',
-            'company_name': 'Your Company',
-            'message': 'This is a sample message',
-            'date': pd.Timestamp.now().strftime('%B %d, %Y')
-        }
-        
-        for key, value in defaults.items():
-            if key not in sample or not sample[key]:
-                sample[key] = value
-        
-        return sample
+        return dict(MergeContext().layer(recipient_dict))
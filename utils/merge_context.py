@@ -0,0 +1,92 @@
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+# Filled in when a recipient's value is missing or empty
+SAMPLE_DEFAULTS = {
+    'sender_name': 'Your Company',
+    'company_name': 'Your Company',
+    'message': 'This is a sample message'
+}
+
+# Filled in only when a recipient has no such field at all
+SAMPLE_FALLBACKS = {
+    'name': 'John Doe',
+    'company': 'Example Corp'
+}
+
+
+class MergeView(Mapping):
+    """
+    A recipient's merge fields with the campaign defaults layered underneath
+
+    Lookups fall through from the recipient to the campaign's field values
+    to the sample defaults, like a ChainMap where empty values also fall
+    through. Nothing is copied; use dict(view) for a plain dict.
+    """
+
+    __slots__ = ('_context', '_recipient')
+
+    def __init__(self, context: 'MergeContext', recipient: Mapping):
+        self._context = context
+        self._recipient = recipient
+
+    @property
+    def data(self) -> Mapping:
+        """The recipient's own fields"""
+        return self._recipient
+
+    def __getitem__(self, key: str):
+        context = self._context
+        present = key in self._recipient
+        if present:
+            value = self._recipient[key]
+            if value:
+                return value
+        if key in context.field_values:
+            value = context.field_values[key]
+            if value:
+                return value
+            present = True
+        if key in context.defaults:
+            return context.defaults[key]
+        if not present:
+            return SAMPLE_FALLBACKS[key]
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._recipient
+        for key in self._context.keys:
+            if key not in self._recipient:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self._recipient) + sum(1 for key in self._context.keys if key not in self._recipient)
+
+    def __contains__(self, key) -> bool:
+        return key in self._recipient or key in self._context.keys
+
+    def __repr__(self) -> str:
+        return f"MergeView({dict(self)!r})"
+
+
+class MergeContext:
+    """
+    Campaign-wide merge-field defaults, resolved once per send
+
+    Holds the campaign's field values and the sample defaults (including
+    today's date, formatted once) and layers them under each recipient with
+    `layer`, the same result CSVParser.create_sample_data gives after the
+    field values are filled in.
+    """
+
+    def __init__(self, field_values: Optional[Dict] = None, now: Optional[datetime] = None):
+        self.field_values = dict(field_values or {})
+        self.defaults = dict(SAMPLE_DEFAULTS)
+        self.defaults['date'] = (now or datetime.now()).strftime('%B %d, %Y')
+        # Every field a layered recipient has besides its own
+        self.keys = tuple(dict.fromkeys([*self.field_values, *SAMPLE_FALLBACKS, *self.defaults]))
+
+    def layer(self, recipient: Mapping) -> MergeView:
+        """The recipient's merge fields with the defaults underneath"""
+        return MergeView(self, recipient)
@@ -0,0 +1,124 @@
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List
+import pandas as pd
+import pyarrow as pa
+
+# Rows converted to Python values at a time while iterating
+_BATCH_SIZE = 1000
+
+
+class RecipientRow(Mapping):
+    """
+    Read-only view of one recipient in a RecipientStore
+
+    Works wherever a recipient dict is read, e.g. as merge fields for
+    str.format(**row) and compiled templates. Use dict(row) for a copy.
+    """
+
+    __slots__ = ('_positions', '_columns', '_index')
+
+    def __init__(self, positions: Dict[str, int], columns: List[List[str]], index: int):
+        self._positions = positions
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, key: str) -> str:
+        return self._columns[self._positions[key]][self._index]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._positions)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, key) -> bool:
+        return key in self._positions
+
+    def __repr__(self) -> str:
+        return f"RecipientRow({dict(self)!r})"
+
+
+class RecipientStore:
+    """
+    Recipients stored column by column in an Arrow table of strings
+
+    Each column is one contiguous UTF-8 buffer, so a recipient costs its
+    text plus a few bytes of offsets instead of a dict of Python strings.
+    Iterating yields RecipientRow views, converting a batch of rows to
+    Python strings at a time; no per-recipient dicts are built. Stores
+    pickle, so they can be cached and kept in st.session_state.
+    """
+
+    def __init__(self, table: pa.Table):
+        self._table = table.combine_chunks()
+        self._positions = {name: i for i, name in enumerate(table.column_names)}
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> 'RecipientStore':
+        """Store the rows of a dataframe, with every value as a string"""
+        df = df.fillna('').astype(str)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        return cls(table.cast(pa.schema([(name, pa.string()) for name in table.column_names])))
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict], batch_size: int = 50000) -> 'RecipientStore':
+        """
+        Store recipients from any iterable of dicts, e.g. CSVParser.iter_recipients
+
+        Only `batch_size` dicts are held at a time. Every record must have
+        the fields of the first one.
+        """
+        schema = None
+        batches = []
+        batch = []
+        for record in records:
+            if schema is None:
+                schema = pa.schema([(name, pa.string()) for name in record])
+            batch.append(record)
+            if len(batch) >= batch_size:
+                batches.append(pa.RecordBatch.from_pylist(batch, schema=schema))
+                batch = []
+        if schema is None:
+            schema = pa.schema([('email', pa.string())])
+        if batch:
+            batches.append(pa.RecordBatch.from_pylist(batch, schema=schema))
+        return cls(pa.Table.from_batches(batches, schema=schema))
+
+    @property
+    def fields(self) -> List[str]:
+        """Column names, shared by every row"""
+        return list(self._positions)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the column buffers"""
+        return self._table.nbytes
+
+    def __len__(self) -> int:
+        return self._table.num_rows
+
+    def __getitem__(self, index: int) -> RecipientRow:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("recipient index out of range")
+        row = self._table.slice(index, 1)
+        return RecipientRow(self._positions, [column.to_pylist() for column in row.columns], 0)
+
+    def __iter__(self) -> Iterator[RecipientRow]:
+        for batch in self._table.to_batches(max_chunksize=_BATCH_SIZE):
+            columns = [column.to_pylist() for column in batch.columns]
+            for index in range(batch.num_rows):
+                yield RecipientRow(self._positions, columns, index)
+
+    def column(self, name: str) -> pd.Series:
+        """One field of every recipient"""
+        return self._table.column(name).to_pandas()
+
+    def filter(self, mask) -> 'RecipientStore':
+        """A store of the recipients where the boolean mask is true"""
+        return RecipientStore(self._table.filter(pa.array(mask, type=pa.bool_())))
+
+    def head(self, rows: int = 10) -> pd.DataFrame:
+        """The first rows as a dataframe, for previews"""
+        return self._table.slice(0, rows).to_pandas()
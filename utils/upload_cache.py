@@ -0,0 +1,117 @@
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+from typing import Any, Optional
+from config import Config
+
+# Bump when the cached result format changes so old entries are ignored
+CACHE_VERSION = b'4'
+
+
+def _user_id() -> str:
+    """Suffix keeping the default directory separate per local user"""
+    return str(os.getuid()) if hasattr(os, 'getuid') else 'user'
+
+
+class UploadCache:
+    """
+    Disk cache of parsed and validated uploads, keyed by a hash of the file bytes
+
+    Entries are pickled into one file each in `directory`, so they survive
+    Streamlit reruns and are shared by every session and process on the
+    machine. A hit refreshes the entry's mtime; once there are more than
+    `max_entries` entries the least recently used are deleted.
+
+    Since entries are unpickled, the directory must be private: it is
+    created with mode 0o700, and a directory owned by another user or
+    writable by others disables the cache instead of being trusted.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_entries: Optional[int] = None):
+        self.directory = directory or Config.UPLOAD_CACHE_DIR or os.path.join(
+            tempfile.gettempdir(), f"emailer_upload_cache_{_user_id()}"
+        )
+        self.max_entries = max_entries or Config.UPLOAD_CACHE_SIZE
+        self.enabled = self._prepare_directory()
+
+    def _prepare_directory(self) -> bool:
+        """Create the cache directory, or check that an existing one is private to this user"""
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            info = os.lstat(self.directory)
+        except OSError as e:
+            print(f"Upload cache disabled: {str(e)}")
+            return False
+        if not stat.S_ISDIR(info.st_mode):
+            print(f"Upload cache disabled: {self.directory} is not a directory")
+            return False
+        if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o022):
+            print(f"Upload cache disabled: {self.directory} is not private to this user")
+            return False
+        return True
+
+    @staticmethod
+    def content_key(data: bytes) -> str:
+        """Cache key for uploaded file contents"""
+        return hashlib.blake2b(CACHE_VERSION + data, digest_size=20).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Cached value for a key, or None"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # A corrupt or incompatible entry is dropped and recomputed
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, value: Any):
+        """Store a value, evicting the least recently used entries if over capacity"""
+        if not self.enabled:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # Atomic, so concurrent readers never see a partial entry
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass